@@ -52,6 +52,8 @@ class Agent(AgentInterface):
               the `successors()` method of the `state`. In other words,
               `state.successors()` return a list of pairs of `action` and its
               corresponding next state.
+              `state.legal_actions()` and `state.child(action)` do the same
+              lazily, one action at a time.
 
         Parameters
         ----------
@@ -96,8 +98,17 @@ class Agent(AgentInterface):
         #    simulator = Game(FirstAgent(), SecondAgent())
         #    winner = simulator.play(starting_state=specified_state)
         #    ```
-        #    The `Markov` has illustrated a concrete example of this
-        #    pattern.
+        #    The `playout()` function of `envs/konquest.py` does the same
+        #    with random actions much faster; the `Markov` agent uses it.
+        #
+        # 3. If `decide` takes a `deadline` argument, the game tells you how
+        #    much time you have left with `deadline.remaining()`, and
+        #    `deadline.expired()` tells you when to stop.
+        #
+        # 4. To see how much your search does, set `self.stats` to a new
+        #    `SearchStats` (from `search_stats.py`) in `decide` and count the
+        #    nodes, cutoffs and depths in it, as `MinimaxAgent` does. The
+        #    metrics of `Game.play` report it after every decision.
         #
         #
         #
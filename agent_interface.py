@@ -27,12 +27,20 @@ class AgentInterface:
 
         NOTE: You can find the possible actions from `state` by calling
               `state.successors()`, which returns a list of pairs of
-              `(action, successor_state)`.
+              `(action, successor_state)`. If you do not need every
+              successor, `state.legal_actions()` generates the actions and
+              `state.child(action)` builds the successor of one of them.
 
         This is a generator function; it means it should have no `return`
         statement, but it should `yield` a sequence of increasing good
         actions.
 
+        NOTE: if `decide` also takes a `deadline` argument, the game passes a
+              `time_limit.Deadline`: `deadline.remaining()` is the number of
+              seconds left and `deadline.expired()` tells when to stop. An
+              agent that stops by itself keeps its last yielded action
+              without being interrupted.
+
         Parameters
         ----------
         state: State
@@ -1,4 +1,4 @@
-from typing import List, Tuple, Optional
+from typing import Iterator, List, Tuple, Optional
 from dataclasses import MISSING
 
 
@@ -11,12 +11,20 @@ class AbstractAction:
 
 
 class AbstractState:
+    __slots__ = ()
+
     def __str__(self) -> str:
         raise NotImplementedError
 
     def successors(self) -> List[Tuple[AbstractAction, 'AbstractState']] :
         raise NotImplementedError
 
+    def legal_actions(self) -> Iterator[AbstractAction]:
+        raise NotImplementedError
+
+    def child(self, action: AbstractAction) -> 'AbstractState':
+        raise NotImplementedError
+
     def is_winner(self) -> Optional[int]:
         """
         Determines if there is a winner in the current state or not
@@ -1,11 +1,16 @@
-from typing import List, Tuple, Optional
+from typing import Iterator, List, NamedTuple, Tuple, Optional
 from string import ascii_uppercase as alphabet
-from copy import deepcopy
+from array import array
 from dataclasses import dataclass
 from enum import Enum
+from functools import lru_cache
+from hashlib import blake2b
 from random import randrange, shuffle
-from itertools import product, combinations
-from math import sqrt, ceil, isclose
+from itertools import combinations
+from math import sqrt, ceil
+from copy import deepcopy
+from struct import Struct, pack, unpack_from
+from weakref import WeakValueDictionary
 
 from envs.environment import AbstractPlayer, AbstractState, AbstractAction
 
@@ -21,6 +26,65 @@ class ID(Enum):
     NEUTRAL = "wheat"
 
 
+# The universe stores owners as small integers; `OWNERS[i]` is the `ID` of
+# the owner stored as `i`.
+OWNERS = tuple(ID)
+NEUTRAL = OWNERS.index(ID.NEUTRAL)
+_OWNER_INDEX = {id_: i for i, id_ in enumerate(OWNERS)}
+
+# Number of integers a fleet takes in the fleet buckets of a universe
+FLEET_FIELDS = 5
+
+# The running totals of an owner in a universe; see `Universe.totals()`
+_PLANET_SHIPS = 0                    # In hundredths of a ship
+_FLEET_SHIPS = 1                     # In hundredths of a ship
+_PLANETS = 2
+_PRODUCTION = 3                      # In percent of a ship per turn
+_FLEETS = 4
+_FULL_PLANETS = 5
+_TOTALS_FIELDS = 6
+
+# Universes are hashed with 64-bit Zobrist-style keys (see `Universe.key`).
+# Instead of random tables, every feature is hashed by `_mix`, so the keys are
+# the same in every process. The features are added rather than XORed, so two
+# identical fleets do not cancel each other out.
+_MASK = (1 << 64) - 1
+_OWNER_FEATURE = 1 << 60
+_SHIPS_FEATURE = 2 << 60
+_FLEET_FEATURE = 3 << 60
+_SIDE_FEATURE = 4 << 60
+
+
+def _mix(x: int) -> int:
+    # The finalizer of SplitMix64
+    x = (x + 0x9E3779B97F4A7C15) & _MASK
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & _MASK
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & _MASK
+    return x ^ (x >> 31)
+
+
+@lru_cache(maxsize=None)
+def _fleet_key(owner: int, ships: int, destination_id: int, arrival: int):
+    return _mix(_FLEET_FEATURE
+                | (arrival & 0xFFFFFF) << 24
+                | destination_id << 16
+                | ships << 4
+                | owner)
+
+
+@lru_cache(maxsize=None)
+def _side_key(current_player: int, remaining_turns: int):
+    return _mix(_SIDE_FEATURE
+                | current_player << 32
+                | (remaining_turns & 0xFFFFFFFF))
+
+
+# The version of the layout of `Galaxy.to_bytes()` and `Universe.to_bytes()`
+FORMAT_VERSION = 1
+# The galaxies that are alive, by id; see `Galaxy.from_bytes()`
+_GALAXIES: 'WeakValueDictionary[int, Galaxy]' = WeakValueDictionary()
+
+
 @dataclass
 class Player(AbstractPlayer):
     name: str                        # Player name
@@ -42,6 +106,11 @@ class Action(AbstractAction):
 
 @dataclass
 class Fleet:
+    """ A read-only snapshot of a fleet stored in a `Universe` """
+
+    __slots__ = ("fleet_id", "owner", "ships", "distance",
+                 "source_id", "destination_id")
+
     fleet_id: int                    # The id of current fleet
     owner: ID                        # Fleet owner
     ships: int                       # Number of ships
@@ -56,6 +125,19 @@ class Fleet:
         return self.fleet_id == __o.fleet_id
 
 
+class Totals(NamedTuple):
+    planet_ships: float              # Ships on the planets
+    fleet_ships: int                 # Ships in flight
+    planets: int                     # Number of planets
+    production: float                # Ships produced per turn
+    fleets: int                      # Number of fleets in flight
+    full_planets: int                # Number of planets at their capacity
+
+    @property
+    def ships(self) -> float:
+        return self.planet_ships + self.fleet_ships
+
+
 class PlanetInfo:
     def __init__(self,
                  name: str,
@@ -86,11 +168,131 @@ class PlanetInfo:
         return self._production / 100
 
 
+def calculate_distance(position1: Tuple[int, int],
+                       position2: Tuple[int, int]) -> int:
+    d_x = position1[0] - position2[0]
+    d_y = position1[1] - position2[1]
+    return ceil(sqrt(d_x ** 2 + d_y ** 2))
+
+
+class Galaxy:
+    """
+    The static part of a map
+
+    Everything in here is fixed after the Big Bang, so all universes of a game
+    share a single instance instead of copying it.
+    Capacities are stored in hundredths of a ship, like the ships of a planet.
+    `distances[i][j]` is the number of turns a fleet needs to travel from the
+    `i`-th planet to the `j`-th one.
+    `ring_size` is the number of turns a universe must look ahead to hold
+    every fleet in flight; see `Universe`.
+    `owner_keys` and `ship_keys` are the Zobrist keys of the planets.
+
+    `id` is a 64-bit hash of the map. A galaxy only has to be serialized once
+    per game (`to_bytes()`); after that, the universes of the game refer to it
+    by its id, and `from_bytes()` returns the galaxy that is already alive in
+    the process if there is one.
+
+    Layout (little-endian), version `FORMAT_VERSION`:
+        B version, H number of planets,
+        then for every planet: h x, h y, H capacity, H production (percent),
+        B length of the name, the name in UTF-8.
+    """
+
+    __slots__ = ("infos", "capacities", "productions", "distances",
+                 "ring_size", "owner_keys", "ship_keys", "id", "__weakref__")
+
+    __HEADER = Struct("<BH")
+    __PLANET = Struct("<hhHHB")
+
+    def __init__(self, infos: List[PlanetInfo]) -> None:
+        self.infos = tuple(infos)
+        self.id = self.__digest(self.to_bytes())
+        self.capacities = array('i', [i.capacity * 100 for i in infos])
+        self.productions = array('i', [i._production for i in infos])
+        self.distances = tuple(tuple(calculate_distance(i.position, j.position)
+                                     for j in infos)
+                               for i in infos)
+        self.ring_size = max(max(row) for row in self.distances) + 1
+        self.owner_keys = tuple(tuple(_mix(_OWNER_FEATURE | i << 8 | owner)
+                                      for owner in range(len(OWNERS)))
+                                for i in range(len(infos)))
+        self.ship_keys = tuple([_mix(_SHIPS_FEATURE | i << 32 | ships)
+                                for ships in range(capacity + 1)]
+                               for i, capacity in enumerate(self.capacities))
+        _GALAXIES.setdefault(self.id, self)
+
+    def __len__(self):
+        return len(self.infos)
+
+    def ships_key(self, planet_id: int, ships: int) -> int:
+        keys = self.ship_keys[planet_id]
+        if 0 <= ships < len(keys):
+            return keys[ships]
+        # Only reachable by setting the ships of a planet by hand
+        return _mix(_SHIPS_FEATURE | planet_id << 32 | (ships & 0xFFFFFFFF))
+
+    def to_bytes(self) -> bytes:
+        output = [self.__HEADER.pack(FORMAT_VERSION, len(self.infos))]
+        for info in self.infos:
+            name = info.name.encode()
+            output.append(self.__PLANET.pack(*info.position,
+                                             info.capacity,
+                                             info._production,
+                                             len(name)))
+            output.append(name)
+        return b"".join(output)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'Galaxy':
+        version, count = cls.__HEADER.unpack_from(data)
+        if version != FORMAT_VERSION:
+            raise ValueError(f"Unsupported galaxy format: {version}")
+        offset = cls.__HEADER.size
+        infos = []
+        for _ in range(count):
+            x, y, capacity, production, length = cls.__PLANET.unpack_from(
+                data, offset)
+            offset += cls.__PLANET.size
+            name = data[offset:offset + length].decode()
+            offset += length
+            infos.append(PlanetInfo(name, (x, y), capacity, production))
+        existing = _GALAXIES.get(cls.__digest(data[:offset]))
+        if existing is not None:
+            return existing
+        return cls(infos)
+
+    @staticmethod
+    def get(galaxy_id: int) -> 'Galaxy':
+        """ Return the galaxy with `galaxy_id` that is alive in this process """
+        try:
+            return _GALAXIES[galaxy_id]
+        except KeyError:
+            raise KeyError(f"Unknown galaxy {galaxy_id:#x}; send its"
+                           f" `to_bytes()` first") from None
+
+    @staticmethod
+    def __digest(data: bytes) -> int:
+        return int.from_bytes(blake2b(data, digest_size=8).digest(), "little")
+
+    def __reduce__(self):
+        # Pickle the map only; the tables are rebuilt (or shared) on loading
+        return Galaxy.from_bytes, (self.to_bytes(),)
+
+
 class Planet:
-    def __init__(self, info: PlanetInfo, owner: ID, ships: int) -> None:
-        self.info = info
-        self.owner = owner
-        self.__ships = ships * 100
+    """
+    A view of a planet stored in a `Universe`
+
+    The planet does not hold any data itself; it reads and writes the flat
+    buffers of its universe.
+    """
+
+    __slots__ = ("_universe", "index")
+
+    def __init__(self, universe: 'Universe', index: int) -> None:
+        self._universe = universe
+        self.index = index
 
     def __str__(self):
         output = "<Planet: "
@@ -100,81 +302,120 @@ class Planet:
         return output
 
     def __hash__(self) -> int:
-        return hash((self.info, self.owner, self.__ships))
+        return hash((self.info, self.owner, self.ships))
 
     def __eq__(self, __o: 'Planet') -> bool:
         return (    self.info == __o.info
                 and self.owner == __o.owner
-                and self.__ships == __o.ships)
+                and self.ships == __o.ships)
 
-    def __deepcopy__(self, memo):
-        cls = self.__class__
-        result = cls.__new__(cls)
-        memo[id(self)] = result
-        for k, v in self.__dict__.items():
-            if k == 'info':
-                # Do not need to deepcopy `info`
-                setattr(result, k, v)
-            else:
-                setattr(result, k, deepcopy(v, memo))
-        return result
+    @property
+    def info(self) -> PlanetInfo:
+        return self._universe._galaxy.infos[self.index]
+
+    @property
+    def owner(self) -> ID:
+        return OWNERS[self._universe._owners[self.index]]
+
+    @owner.setter
+    def owner(self, value: ID):
+        self._universe._owners[self.index] = _OWNER_INDEX[value]
+        self._universe._recompute()
 
     @property
     def ships(self):
-        return round(self.__ships / 100, ndigits=2)
+        return round(self._universe._ships[self.index] / 100, ndigits=2)
 
     @ships.setter
     def ships(self, value: int):
-        self.__ships = value * 100
-        return self
-
-    def produce_ships(self):
-        if self.owner != ID.NEUTRAL:
-            self.__ships = min(self.info.capacity * 100,
-                               self.info._production + self.__ships)
-        return self
+        self._universe._ships[self.index] = round(value * 100)
+        self._universe._recompute()
 
     def calculate_distance(self, position: Tuple[int, int]):
-        d_x = self.info.position[0] - position[0]
-        d_y = self.info.position[1] - position[1]
-        return ceil(sqrt(d_x ** 2 + d_y ** 2))
+        return calculate_distance(self.info.position, position)
 
-    def arrival(self, fleet: Fleet):
-        if fleet.owner == self.owner:
-            # Reinforce the defense
-            self.__ships = min(self.info.capacity * 100,
-                               self.__ships + fleet.ships * 100)
-            return self
-        return self.__combat(fleet)
-
-    def __combat(self, fleet: Fleet):
-        KILL_RATE = 70 # percent 
-        remaining_defender = self.__ships - KILL_RATE * fleet.ships
-        if remaining_defender < 0:
-            self.owner = fleet.owner
-            alive_ships = int(100 * fleet.ships - 100 * self.__ships / 70)
-            self.__ships = min(self.info.capacity * 100, alive_ships)
-            return self
-        self.__ships = remaining_defender
-        return self
+    def distance_to(self, other: 'Planet') -> int:
+        return self._universe._galaxy.distances[self.index][other.index]
+
+
+class Undo:
+    """
+    The record returned by `Universe.apply()`
+
+    `owners`, `ships` and `arrived` are only set when the move ended the turn;
+    they hold the planets before production and combat, and the bucket of the
+    fleets that arrived at the end of the turn.
+    """
+
+    __slots__ = ("action", "current_player", "key", "totals",
+                 "owners", "ships", "arrived")
+
+    def __init__(self,
+                 action: Action,
+                 current_player: int,
+                 key: int,
+                 totals: array) -> None:
+        self.action = action
+        self.current_player = current_player
+        self.key = key
+        self.totals = totals
+        self.owners = None
+        self.ships = None
+        self.arrived = None
 
 
 class Universe(AbstractState):
+    """
+    The state of a Konquest game
+
+    The state is kept in flat integer buffers (struct of arrays), so cloning a
+    universe only copies a few buffers:
+        * `_owners[i]` and `_ships[i]` are the owner and the ships of the
+          `i`-th planet; ships are stored in hundredths of a ship,
+        * fleets are kept in a ring of buckets indexed by the turn they
+          arrive at: the fleets arriving at turn `t` are in
+          `_fleets[t % ring_size]`, in the order they have been launched.
+          Each fleet takes `FLEET_FIELDS` consecutive integers of its bucket:
+          its id, owner, ships, source and destination. Fleets carry whole
+          ships.
+    Ending a turn only touches the bucket of the fleets that arrive.
+    The map itself lives in a `Galaxy` that is shared between clones.
+
+    `planets` and `fleets` are views of these buffers for the agents.
+
+    `key` is a 64-bit hash of the position that is updated along with the
+    state. It is the sum of the Zobrist keys of the planets (owner and ships),
+    of the fleets in flight (owner, ships, destination and arrival turn, but
+    not their ids), and of the player to move with the remaining turns.
+
+    The universe also keeps running totals for every owner (ships on planets
+    and in flight, planets, production, fleets and full planets), so
+    `is_winner()` and `totals()` do not have to look at every planet and fleet.
+    """
+
     __SIZE = (4, 3)
     __CAPACITY = (4, 12)
     __PRODUCTION_RANGE = (40, 130)  # percent
     __MIN_PLAYER_DISTANCE = 4
     __MAX_TURN = 200
+    __KILL_RATE = 70                # percent
+    __HEADER = Struct("<BQBBhii")
+
+    __slots__ = ("__players", "__current_player", "__fleet_counter",
+                 "__planet_views", "__turn", "__key", "remaining_turns",
+                 "_galaxy", "_owners", "_ships", "_fleets", "_totals")
 
     def __init__(self, player_names: List[str], neutrals_count: int):
         assert len(player_names) < len(ID),  f"We support {len(ID) - 1} players"
         self.__players = [Player(p, i) for p, i in zip(player_names, ID)]
         self.__current_player = 0
-        self.planets: List[Planet] = []
-        self.fleets: List[Fleet] = []
         self.__fleet_counter = 0
+        self.__planet_views = None
+        self.__turn = 0
         self.remaining_turns = self.__MAX_TURN
         self.__big_bang(neutrals_count)
+        self._fleets = [array('i') for _ in range(self._galaxy.ring_size)]
+        self._recompute()
 
     @property
     def current_player(self) -> int:
@@ -183,22 +424,75 @@ class Universe(AbstractState):
     @property
     def current_player_id(self) -> ID:
         return self.__players[self.__current_player].id_
-    
+
     @property
     def players(self) -> List[Player]:
         return self.__players.copy()
 
+    def totals(self, id_: ID) -> Totals:
+        """ Return the running totals of `id_`; this takes constant time """
+        i = _OWNER_INDEX[id_] * _TOTALS_FIELDS
+        totals = self._totals
+        return Totals(totals[i + _PLANET_SHIPS] / 100,
+                      totals[i + _FLEET_SHIPS] // 100,
+                      totals[i + _PLANETS],
+                      totals[i + _PRODUCTION] / 100,
+                      totals[i + _FLEETS],
+                      totals[i + _FULL_PLANETS])
+
+    @property
+    def key(self) -> int:
+        """ The Zobrist key of the position; see `Universe` """
+        return self.__key
+
+    @property
+    def galaxy(self) -> Galaxy:
+        return self._galaxy
+
+    @property
+    def distances(self) -> Tuple[Tuple[int, ...], ...]:
+        """ The travel time between every two planets; see `Galaxy` """
+        return self._galaxy.distances
+
+    @property
+    def planets(self) -> List[Planet]:
+        if self.__planet_views is None:
+            self.__planet_views = [Planet(self, i)
+                                   for i in range(len(self._galaxy))]
+        return self.__planet_views
+
+    @property
+    def fleets(self) -> List[Fleet]:
+        return [Fleet(fleet_id, OWNERS[owner], ships, arrival - self.__turn,
+                      source_id, destination_id)
+                for (fleet_id, owner, ships, source_id, destination_id,
+                     arrival) in self.__fleet_records()]
+
+    def __fleet_records(self):
+        # Generates every fleet in flight, followed by its arrival turn
+        buckets = self._fleets
+        for arrival in range(self.__turn, self.__turn + len(buckets)):
+            bucket = buckets[arrival % len(buckets)]
+            for i in range(0, len(bucket), FLEET_FIELDS):
+                yield (*bucket[i:i + FLEET_FIELDS], arrival)
+
     def __hash__(self):
-        return hash((self.__current_player,
-                     tuple(self.planets),
-                     tuple(self.fleets),
-                     self.remaining_turns))
+        return self.__key
 
     def __eq__(self, __o: 'Universe') -> bool:
-        return (    self.__current_player == __o.__current_player
-                and self.planets == __o.planets
-                and self.fleets == __o.fleets
-                and self.remaining_turns == __o.remaining_turns)
+        return (    self.__key == __o.__key
+                and self.__current_player == __o.__current_player
+                and self.remaining_turns == __o.remaining_turns
+                and self._galaxy.infos == __o._galaxy.infos
+                and self._owners == __o._owners
+                and self._ships == __o._ships
+                and self.__fleets_in_flight() == __o.__fleets_in_flight())
+
+    def __fleets_in_flight(self):
+        # The fleets regardless of their ids and of the order of launch
+        return sorted((owner, ships, destination_id, arrival)
+                      for (_, owner, ships, _, destination_id,
+                           arrival) in self.__fleet_records())
 
     def __str__(self) -> str:
         out  = "****************************************************\n"
@@ -225,7 +519,7 @@ class Universe(AbstractState):
         for fleet in sorted(self.fleets, key=lambda f: f.distance):
             out += fleets.format(fleet.owner.name,
                                  fleet.ships,
-                                 self.planets[fleet.destination_id].info.name,
+                                 self._galaxy.infos[fleet.destination_id].name,
                                  fleet.distance)
         out += "{:=^33}\n".format("")
 
@@ -234,10 +528,10 @@ class Universe(AbstractState):
         return out
 
     def initialize(self):
-        for planet in self.planets:
-            planet.ships = planet.info.capacity
-        for planet, player in zip(self.planets, self.__players):
-            planet.owner = player.id_
+        self._ships = array('i', self._galaxy.capacities)
+        for i, player in enumerate(self.__players[:len(self._galaxy)]):
+            self._owners[i] = _OWNER_INDEX[player.id_]
+        self._recompute()
         return self
 
     def rotate_players(self):
@@ -245,50 +539,156 @@ class Universe(AbstractState):
         return self
 
     def successors(self) -> List[Tuple[Action, 'Universe']]:
-        applicable_actions = self.__applicable_actions()
         successors = []
-        for action in applicable_actions:
-            successors.append((action, self.__apply(action)))
-        shuffle(successors) 
+        for action in self.legal_actions():
+            successors.append((action, self.child(action)))
+        shuffle(successors)
         return successors
 
     def is_winner(self) -> Optional[int]:
+        totals = self._totals
         ships = {}
-        for planet in self.planets:
-            ships[planet.owner] = ships.get(planet.owner, 0) + planet.ships
-        for fleet in self.fleets:
-            ships[fleet.owner] = ships.get(fleet.owner, 0) + fleet.ships
-        ships.pop(ID.NEUTRAL, None)
+        for owner in range(len(OWNERS)):
+            i = owner * _TOTALS_FIELDS
+            if owner == NEUTRAL:
+                continue
+            if totals[i + _PLANETS] or totals[i + _FLEETS]:
+                ships[owner] = (  totals[i + _PLANET_SHIPS]
+                                + totals[i + _FLEET_SHIPS])
         # Following condition is not possible
         # if len(ships) == 0:
         #     return 0
+        current_player_id = self.__players[self.__current_player].id_
         if len(ships) == 1:
-            current_player_id = self.__players[self.__current_player].id_
-            return 1 if ships.popitem()[0] == current_player_id else -1
+            return 1 if OWNERS[ships.popitem()[0]] == current_player_id else -1
         if self.remaining_turns == 0:
             ships = sorted(ships.items(), key=lambda i: i[1], reverse=True)
-            if isclose(ships[0][1], ships[1][1]):
+            if ships[0][1] == ships[1][1]:
                 return 0
-            current_player_id = self.__players[self.__current_player].id_
-            return 1 if ships[0][0] == current_player_id else -1
+            return 1 if OWNERS[ships[0][0]] == current_player_id else -1
         return None
 
     def clone(self):
-        # Returns a shallow copy of the current universe
+        # Returns a copy of the current universe; the galaxy is shared
         cls = self.__class__
         cloned = cls.__new__(cls)
         cloned.__players = self.__players
         cloned.__current_player = self.__current_player
         cloned.__fleet_counter = self.__fleet_counter
+        cloned.__planet_views = None
+        cloned.__turn = self.__turn
+        cloned.__key = self.__key
         cloned.remaining_turns = self.remaining_turns
-        cloned.planets = deepcopy(self.planets)
-        cloned.fleets = deepcopy(self.fleets)
+        cloned._galaxy = self._galaxy
+        cloned._owners = self._owners[:]
+        cloned._ships = self._ships[:]
+        cloned._fleets = [bucket[:] for bucket in self._fleets]
+        cloned._totals = self._totals[:]
+        return cloned
+
+    def __deepcopy__(self, memo):
+        # The galaxy never changes, so there is no need to copy it
+        cloned = self.clone()
+        cloned.__players = deepcopy(self.__players, memo)
         return cloned
 
+    def __reduce__(self):
+        return Universe.from_bytes, (self.to_bytes(), self._galaxy)
+
+    def to_bytes(self) -> bytes:
+        """
+        Serialize the universe; the galaxy is only referenced by its id
+
+        Layout (little-endian), version `FORMAT_VERSION`:
+            B version, Q galaxy id, B number of players, B current player,
+            h remaining turns, i turn, i fleet counter,
+            then for every player: B owner, B length of the name, the name in
+            UTF-8,
+            then the owner (b) of every planet and the ships (i) of every
+            planet,
+            then for each of the next `ring_size` turns: H number of fleets
+            arriving, and `FLEET_FIELDS` integers (i) per fleet.
+        """
+        planets_count = len(self._galaxy)
+        output = [self.__HEADER.pack(FORMAT_VERSION,
+                                     self._galaxy.id,
+                                     len(self.__players),
+                                     self.__current_player,
+                                     self.remaining_turns,
+                                     self.__turn,
+                                     self.__fleet_counter)]
+        for player in self.__players:
+            name = player.name.encode()
+            output.append(pack("<BB", _OWNER_INDEX[player.id_], len(name)))
+            output.append(name)
+        output.append(pack(f"<{planets_count}b{planets_count}i",
+                           *self._owners,
+                           *self._ships))
+        ring_size = len(self._fleets)
+        for arrival in range(self.__turn, self.__turn + ring_size):
+            bucket = self._fleets[arrival % ring_size]
+            output.append(pack(f"<H{len(bucket)}i",
+                               len(bucket) // FLEET_FIELDS,
+                               *bucket))
+        return b"".join(output)
+
+    @classmethod
+    def from_bytes(cls,
+                   data: bytes,
+                   galaxy: Optional[Galaxy] = None) -> 'Universe':
+        """
+        Rebuild a universe from `to_bytes()`
+
+        If `galaxy` is not given, the galaxy of the universe must be alive in
+        this process; see `Galaxy.from_bytes()`.
+        """
+        (version, galaxy_id, players_count, current_player, remaining_turns,
+         turn, fleet_counter) = cls.__HEADER.unpack_from(data)
+        if version != FORMAT_VERSION:
+            raise ValueError(f"Unsupported universe format: {version}")
+        if galaxy is None:
+            galaxy = Galaxy.get(galaxy_id)
+        elif galaxy.id != galaxy_id:
+            raise ValueError("The universe belongs to another galaxy")
+        offset = cls.__HEADER.size
+        players = []
+        for _ in range(players_count):
+            owner, length = unpack_from("<BB", data, offset)
+            offset += 2
+            name = data[offset:offset + length].decode()
+            offset += length
+            players.append(Player(name, OWNERS[owner]))
+        planets_count = len(galaxy)
+        owners = array('b', data[offset:offset + planets_count])
+        offset += planets_count
+        ships = array('i', unpack_from(f"<{planets_count}i", data, offset))
+        offset += 4 * planets_count
+        ring_size = galaxy.ring_size
+        fleets = [array('i') for _ in range(ring_size)]
+        for arrival in range(turn, turn + ring_size):
+            count, = unpack_from("<H", data, offset)
+            offset += 2
+            fleets[arrival % ring_size] = array(
+                'i', unpack_from(f"<{count * FLEET_FIELDS}i", data, offset))
+            offset += 4 * count * FLEET_FIELDS
+
+        universe = cls.__new__(cls)
+        universe.__players = players
+        universe.__current_player = current_player
+        universe.__fleet_counter = fleet_counter
+        universe.__planet_views = None
+        universe.__turn = turn
+        universe.remaining_turns = remaining_turns
+        universe._galaxy = galaxy
+        universe._owners = owners
+        universe._ships = ships
+        universe._fleets = fleets
+        return universe._recompute()
+
     def __big_bang(self, neutral_count):
         while True:
             names = list(alphabet)
-            self.planets = []
+            infos = []
             for i in range(len(self.__players)):
                 position = (randrange(self.__SIZE[0]),
                             randrange(self.__SIZE[1]))
@@ -296,9 +696,9 @@ class Universe(AbstractState):
                                          position,
                                          self.__CAPACITY[1] - 2,
                                          100)
-                self.planets.append(Planet(planet_info, ID.NEUTRAL, 0))
-            for planet1, planet2 in combinations(self.planets, r=2):
-                distance = planet1.calculate_distance(planet2.info.position)
+                infos.append(planet_info)
+            for info1, info2 in combinations(infos, r=2):
+                distance = calculate_distance(info1.position, info2.position)
                 if distance < self.__MIN_PLAYER_DISTANCE:
                     # Too close! we should rearrange them
                     break
@@ -309,9 +709,9 @@ class Universe(AbstractState):
             while True:
                 position = (randrange(self.__SIZE[0]),
                             randrange(self.__SIZE[1]))
-                for planet in self.planets:
+                for info in infos:
                     # Two planets cannot be placed on the exact same locaiton
-                    if position == planet.info.position:
+                    if position == info.position:
                         break
                 else:
                     break
@@ -319,66 +719,282 @@ class Universe(AbstractState):
             capacity = randrange(*self.__CAPACITY)
             production = randrange(*self.__PRODUCTION_RANGE)
             planet_info = PlanetInfo(names[i], position, capacity, production)
-            self.planets.append(Planet(planet_info, ID.NEUTRAL, 0))
+            infos.append(planet_info)
+
+        self._galaxy = Galaxy(infos)
+        self._owners = array('b', [NEUTRAL] * len(infos))
+        self._ships = array('i', [0] * len(infos))
 
         print("#{:#^72}#".format(""))
         print("#{: ^72}#".format("Big Bang!"))
         print("#{:#^72}#".format(""))
-        for planet in self.planets:
-            print("#{: <72}#".format(" " + str(planet.info)))
+        for info in infos:
+            print("#{: <72}#".format(" " + str(info)))
         print("#{:#^72}#".format(""))
         print()
         return self
 
-    def __applicable_actions(self):
-        player_id = self.__players[self.__current_player].id_
-        sources = [i
-                   for i, p in enumerate(self.planets)
-                   if p.owner == player_id]
-        # planets_ships = [int(self.planets[s].ships) for s in sources]
-        # counts = range(1, max(planets_ships + [0]) + 1)
-        counts = [2, 4, 8]
-        attacks = [Action(c, s, d)
-                   for c, s, d in product(counts,
-                                          sources,
-                                          range(len(self.planets)))
-                   if s != d and c <= self.planets[s].ships]
-        fortified = Action(0, -1, -1)
-        attacks.append(fortified)
-        return attacks
-
-    def __apply(self, attack: Action):
+    def legal_actions(self) -> Iterator[Action]:
+        """
+        Generate the actions the current player can take
+
+        Unlike `successors()`, this does not build the next states; use it
+        together with `child()`, or with `apply()` and `undo()`. The actions
+        are generated lazily, so a search that cuts off early never creates
+        the rest of them.
+        """
+        player = _OWNER_INDEX[self.__players[self.__current_player].id_]
+        owners = self._owners
+        ships = self._ships
+        planets_count = len(self._galaxy)
+        for count in (2, 4, 8):
+            for source_id in range(planets_count):
+                if (   owners[source_id] != player
+                    or ships[source_id] < count * 100):
+                    continue
+                for destination_id in range(planets_count):
+                    if source_id != destination_id:
+                        yield Action(count, source_id, destination_id)
+        # Fortify
+        yield Action(0, -1, -1)
+
+    def random_action(self) -> Action:
+        """
+        Return one of `legal_actions()` at random, all of them equally likely
+
+        The action is picked by its index, without generating the others.
+        """
+        player = _OWNER_INDEX[self.__players[self.__current_player].id_]
+        owners = self._owners
+        ships = self._ships
+        planets_count = len(self._galaxy)
+        sources = [(count, source_id)
+                   for count in (2, 4, 8)
+                   for source_id in range(planets_count)
+                   if (    owners[source_id] == player
+                       and ships[source_id] >= count * 100)]
+        destinations_count = planets_count - 1
+        index = randrange(len(sources) * destinations_count + 1)
+        if index == len(sources) * destinations_count:
+            # Fortify
+            return Action(0, -1, -1)
+        count, source_id = sources[index // destinations_count]
+        destination_id = index % destinations_count
+        if destination_id >= source_id:
+            destination_id += 1
+        return Action(count, source_id, destination_id)
+
+    def child(self, action: Action) -> 'Universe':
+        """ Return the universe after `action`; `self` is not changed """
         successor = self.clone()
+        successor.apply(action)
+        return successor
+
+    def apply(self, attack: Action) -> 'Undo':
+        """
+        Apply `attack` to the current universe in place
+
+        Returns the record that `undo()` needs to take the move back. Moves
+        must be taken back in the reverse order they have been applied.
+        """
+        record = Undo(attack, self.__current_player, self.__key, self._totals)
+        self._totals = totals = self._totals[:]
+        key = self.__key - _side_key(self.__current_player, self.remaining_turns)
         if attack.ships > 0:
-            distance = (successor
-                        .planets[attack.destination_id]
-                        .calculate_distance(successor
-                                            .planets[attack.source_id]
-                                            .info
-                                            .position))
-            new_fleet = Fleet(self.__fleet_counter,
-                              successor.planets[attack.source_id].owner,
-                              attack.ships,
-                              distance,
-                              attack.source_id,
-                              attack.destination_id)
-            successor.__fleet_counter += 1
-            successor.planets[attack.source_id].ships -= attack.ships
-            successor.fleets.append(new_fleet)
-        successor.__current_player += 1
-        successor.remaining_turns -= 1
-
-        if successor.__current_player == len(successor.__players):
+            galaxy = self._galaxy
+            source_id = attack.source_id
+            distance = galaxy.distances[source_id][attack.destination_id]
+            owner = self._owners[source_id]
+            arrival = self.__turn + distance
+            self._fleets[arrival % len(self._fleets)].extend(
+                (self.__fleet_counter,
+                 owner,
+                 attack.ships,
+                 source_id,
+                 attack.destination_id))
+            self.__fleet_counter += 1
+            ships = self._ships[source_id]
+            self._ships[source_id] = ships - attack.ships * 100
+            i = owner * _TOTALS_FIELDS
+            totals[i + _PLANET_SHIPS] -= attack.ships * 100
+            totals[i + _FLEET_SHIPS] += attack.ships * 100
+            totals[i + _FLEETS] += 1
+            if ships == galaxy.capacities[source_id]:
+                totals[i + _FULL_PLANETS] -= 1
+            key += (  galaxy.ships_key(source_id, ships - attack.ships * 100)
+                    - galaxy.ships_key(source_id, ships)
+                    + _fleet_key(owner,
+                                 attack.ships,
+                                 attack.destination_id,
+                                 arrival))
+        self.__key = key
+        self.__current_player += 1
+        self.remaining_turns -= 1
+
+        if self.__current_player == len(self.__players):
             # End of turn; we should update planets and fleets
-            for planet in successor.planets:
-                planet.produce_ships()
-            new_fleets = []
-            for fleet in successor.fleets:
-                if fleet.distance == 0:
-                    successor.planets[fleet.destination_id].arrival(fleet)
-                else:
-                    fleet.distance -= 1
-                    new_fleets.append(fleet)
-            successor.fleets = new_fleets
-            successor.__current_player = 0
-        return successor
\ No newline at end of file
+            # Keep the planets aside and carry on with a copy of them
+            record.owners = self._owners
+            record.ships = self._ships
+            self._owners = self._owners[:]
+            self._ships = self._ships[:]
+            record.arrived = self.__end_turn()
+            self.__current_player = 0
+        self.__key = (self.__key
+                      + _side_key(self.__current_player, self.remaining_turns)
+                      ) & _MASK
+        return record
+
+    def undo(self, record: 'Undo'):
+        """ Take back the move that returned `record` from `apply()` """
+        if record.arrived is not None:
+            # Production and combats only changed the planets
+            self._owners = record.owners
+            self._ships = record.ships
+            self.__turn -= 1
+            self._fleets[self.__turn % len(self._fleets)] = record.arrived
+        self.__current_player = record.current_player
+        self.__key = record.key
+        self._totals = record.totals
+        self.remaining_turns += 1
+        attack = record.action
+        if attack.ships > 0:
+            distance = (self._galaxy
+                        .distances[attack.source_id][attack.destination_id])
+            bucket = self._fleets[(self.__turn + distance) % len(self._fleets)]
+            del bucket[-FLEET_FIELDS:]
+            self.__fleet_counter -= 1
+            self._ships[attack.source_id] += attack.ships * 100
+        return self
+
+    def __end_turn(self):
+        # Returns the bucket of the fleets that have arrived
+        galaxy = self._galaxy
+        owners = self._owners
+        ships = self._ships
+        capacities = galaxy.capacities
+        totals = self._totals
+        key = self.__key
+        for i, production in enumerate(galaxy.productions):
+            if owners[i] != NEUTRAL and ships[i] != capacities[i]:
+                produced = min(capacities[i], ships[i] + production)
+                key += (  galaxy.ships_key(i, produced)
+                        - galaxy.ships_key(i, ships[i]))
+                j = owners[i] * _TOTALS_FIELDS
+                totals[j + _PLANET_SHIPS] += produced - ships[i]
+                if produced == capacities[i]:
+                    totals[j + _FULL_PLANETS] += 1
+                ships[i] = produced
+
+        slot = self.__turn % len(self._fleets)
+        arrived = self._fleets[slot]
+        self._fleets[slot] = array('i')
+        self.__key = key
+        for i in range(0, len(arrived), FLEET_FIELDS):
+            owner = arrived[i + 1]
+            fleet_ships = arrived[i + 2]
+            destination_id = arrived[i + 4]
+            self.__key -= _fleet_key(owner,
+                                     fleet_ships,
+                                     destination_id,
+                                     self.__turn)
+            j = owner * _TOTALS_FIELDS
+            totals[j + _FLEET_SHIPS] -= fleet_ships * 100
+            totals[j + _FLEETS] -= 1
+            self.__arrival(owner, fleet_ships, destination_id)
+        self.__turn += 1
+        return arrived
+
+    def __arrival(self, owner: int, fleet_ships: int, destination: int):
+        ships = self._ships[destination]
+        capacity = self._galaxy.capacities[destination]
+        if owner == self._owners[destination]:
+            # Reinforce the defense
+            self.__set_planet(destination,
+                              owner,
+                              min(capacity, ships + fleet_ships * 100))
+            return
+        # Combat
+        remaining_defender = ships - self.__KILL_RATE * fleet_ships
+        if remaining_defender < 0:
+            alive_ships = int(100 * fleet_ships - 100 * ships / 70)
+            self.__set_planet(destination, owner, min(capacity, alive_ships))
+            return
+        self.__set_planet(destination,
+                          self._owners[destination],
+                          remaining_defender)
+
+    def __set_planet(self, planet_id: int, owner: int, ships: int):
+        galaxy = self._galaxy
+        old_owner = self._owners[planet_id]
+        old_ships = self._ships[planet_id]
+        capacity = galaxy.capacities[planet_id]
+        totals = self._totals
+        old = old_owner * _TOTALS_FIELDS
+        new = owner * _TOTALS_FIELDS
+        key = (  self.__key
+               + galaxy.ships_key(planet_id, ships)
+               - galaxy.ships_key(planet_id, old_ships))
+        if owner != old_owner:
+            owner_keys = galaxy.owner_keys[planet_id]
+            key += owner_keys[owner] - owner_keys[old_owner]
+            self._owners[planet_id] = owner
+            production = galaxy.productions[planet_id]
+            totals[old + _PLANETS] -= 1
+            totals[new + _PLANETS] += 1
+            totals[old + _PRODUCTION] -= production
+            totals[new + _PRODUCTION] += production
+        totals[old + _PLANET_SHIPS] -= old_ships
+        totals[new + _PLANET_SHIPS] += ships
+        totals[old + _FULL_PLANETS] -= old_ships == capacity
+        totals[new + _FULL_PLANETS] += ships == capacity
+        self._ships[planet_id] = ships
+        self.__key = key
+
+    def _recompute(self):
+        # Computes `key` and the totals from scratch
+        galaxy = self._galaxy
+        totals = array('i', [0] * (len(OWNERS) * _TOTALS_FIELDS))
+        key = _side_key(self.__current_player, self.remaining_turns)
+        for i, (owner, ships) in enumerate(zip(self._owners, self._ships)):
+            key += galaxy.owner_keys[i][owner] + galaxy.ships_key(i, ships)
+            j = owner * _TOTALS_FIELDS
+            totals[j + _PLANET_SHIPS] += ships
+            totals[j + _PLANETS] += 1
+            totals[j + _PRODUCTION] += galaxy.productions[i]
+            totals[j + _FULL_PLANETS] += ships == galaxy.capacities[i]
+        for (_, owner, ships, _, destination_id,
+             arrival) in self.__fleet_records():
+            key += _fleet_key(owner, ships, destination_id, arrival)
+            j = owner * _TOTALS_FIELDS
+            totals[j + _FLEET_SHIPS] += ships * 100
+            totals[j + _FLEETS] += 1
+        self.__key = key & _MASK
+        self._totals = totals
+        return self
+
+
+def playout(state: Universe,
+            max_plies: Optional[int] = None) -> Optional[List[int]]:
+    """
+    Play random legal actions on `state` in place until the game is over
+
+    This plays the same games as `Game.play()` with two `RandomAgent`s, without
+    their time limits, copies and successors. Returns the winners like
+    `Game.play()`: `[i]` if player `i` won, and `[]` for a draw. If `max_plies`
+    is given, the playout stops after that many actions and returns `None`
+    when the game is not over yet; `state` is then the position reached.
+    """
+    is_winner = state.is_winner()
+    plies = 0
+    while is_winner is None:
+        if plies == max_plies:
+            return None
+        state.apply(state.random_action())
+        plies += 1
+        is_winner = state.is_winner()
+    if is_winner == 0:
+        return []
+    if is_winner == 1:
+        return [state.current_player]
+    return [1 - state.current_player]
@@ -0,0 +1,304 @@
+from typing import List, Optional
+
+import numpy as np
+
+from envs.konquest import Universe, Action, OWNERS, NEUTRAL
+
+
+class BatchUniverse:
+    """
+    Many Konquest games on the same map, simulated at once with NumPy
+
+    Every game of the batch starts as a copy of the given `Universe`; after
+    that, each game moves on its own. The rules are exactly the rules of
+    `Universe`:
+        * the mover launches a fleet (or fortifies),
+        * at the end of a turn, planets produce and then the fleets that
+          arrive fight, in the order they have been launched.
+
+    Actions are encoded as integers: `(count * P + source) * P + destination`,
+    where `count` indexes `COUNTS` and `P` is the number of planets, and
+    `FORTIFY` (the last index) is the "no move" action. `action()` and
+    `index()` convert between these integers and `Action`s.
+
+    `winners()` returns, for every game, the index of the winning player,
+    `DRAW` or `ONGOING`; finished games are not changed by `step()`.
+    """
+
+    COUNTS = (2, 4, 8)
+    KILL_RATE = 70                   # percent
+    DRAW = -1
+    ONGOING = -2
+
+    def __init__(self, state: Universe, size: int):
+        galaxy = state.galaxy
+        self.size = size
+        self.planets_count = len(galaxy)
+        self.players_count = len(state.players)
+        self.FORTIFY = len(self.COUNTS) * self.planets_count ** 2
+        self.capacities = np.array(galaxy.capacities, dtype=np.int64)
+        self.productions = np.array(galaxy.productions, dtype=np.int64)
+        self.distances = np.array(galaxy.distances, dtype=np.int64)
+        self.player_owners = np.array([OWNERS.index(p.id_)
+                                       for p in state.players],
+                                      dtype=np.int8)
+
+        self.owners = np.tile(np.array(state._owners, dtype=np.int8),
+                              (size, 1))
+        self.ships = np.tile(np.array(state._ships, dtype=np.int64), (size, 1))
+        self.current_player = np.full(size, state.current_player, np.int8)
+        self.remaining_turns = np.full(size, state.remaining_turns, np.int64)
+        # Only the order of the turns matters; the batch counts from zero
+        self.turn = np.zeros(size, dtype=np.int64)
+
+        # At most one fleet per player and turn can be in flight for as long
+        # as the longest trip takes
+        fleets_count = self.players_count * galaxy.ring_size
+        fleets = state.fleets
+        assert len(fleets) <= fleets_count, "Too many fleets in flight!"
+        self.fleet_owners = np.full((size, fleets_count), -1, dtype=np.int8)
+        self.fleet_ships = np.zeros((size, fleets_count), dtype=np.int64)
+        self.fleet_destinations = np.zeros((size, fleets_count), dtype=np.int64)
+        self.fleet_arrivals = np.zeros((size, fleets_count), dtype=np.int64)
+        # The fleet ids; they keep the order of launch
+        self.fleet_orders = np.zeros((size, fleets_count), dtype=np.int64)
+        for i, fleet in enumerate(fleets):
+            self.fleet_owners[:, i] = OWNERS.index(fleet.owner)
+            self.fleet_ships[:, i] = fleet.ships
+            self.fleet_destinations[:, i] = fleet.destination_id
+            self.fleet_arrivals[:, i] = fleet.distance
+            self.fleet_orders[:, i] = fleet.fleet_id
+        self.fleet_counter = np.full(size,
+                                     max([f.fleet_id for f in fleets],
+                                         default=-1) + 1,
+                                     dtype=np.int64)
+
+    def action(self, index: int) -> Action:
+        if index == self.FORTIFY:
+            return Action(0, -1, -1)
+        count, rest = divmod(int(index), self.planets_count ** 2)
+        source_id, destination_id = divmod(rest, self.planets_count)
+        return Action(self.COUNTS[count], source_id, destination_id)
+
+    def index(self, action: Action) -> int:
+        if action.ships == 0:
+            return self.FORTIFY
+        count = self.COUNTS.index(action.ships)
+        return ((count * self.planets_count + action.source_id)
+                * self.planets_count + action.destination_id)
+
+    def legal_mask(self) -> np.ndarray:
+        """
+        Return which actions are legal in every game
+
+        The result has one row per game and one column per action index.
+        """
+        mover = self.player_owners[self.current_player]
+        sources = self.owners == mover[:, None]
+        counts = np.array(self.COUNTS, dtype=np.int64)[None, :, None]
+        enough = self.ships[:, None, :] >= counts * 100
+        different = ~np.eye(self.planets_count, dtype=bool)
+        mask = ((sources[:, None, :] & enough)[:, :, :, None]
+                & different[None, None, :, :])
+        mask = mask.reshape(self.size, -1)
+        fortify = np.ones((self.size, 1), dtype=bool)
+        return np.concatenate((mask, fortify), axis=1)
+
+    def random_actions(self, rng: np.random.Generator) -> np.ndarray:
+        """ Pick a legal action uniformly at random in every game """
+        mask = self.legal_mask()
+        choices = np.floor(rng.random(self.size)
+                           * mask.sum(axis=1)).astype(np.int64)
+        return np.argmax(mask.cumsum(axis=1) > choices[:, None], axis=1)
+
+    def winners(self) -> np.ndarray:
+        """
+        Return the winner of every game, like `Universe.is_winner()` does
+
+        The winner is given as a player index rather than relative to the
+        player to move; `DRAW` and `ONGOING` mark the other games.
+        """
+        present = np.zeros((self.size, self.players_count), dtype=bool)
+        totals = np.zeros((self.size, self.players_count), dtype=np.int64)
+        for player, owner in enumerate(self.player_owners):
+            planets = self.owners == owner
+            fleets = self.fleet_owners == owner
+            present[:, player] = planets.any(axis=1) | fleets.any(axis=1)
+            totals[:, player] = ((self.ships * planets).sum(axis=1)
+                                 + (self.fleet_ships * 100
+                                    * fleets).sum(axis=1))
+        winners = np.full(self.size, self.ONGOING, dtype=np.int64)
+        last_turn = self.remaining_turns == 0
+        best = totals.max(axis=1)
+        ties = (totals == best[:, None]).sum(axis=1) > 1
+        winners[last_turn & ties] = self.DRAW
+        leaders = last_turn & ~ties
+        winners[leaders] = np.argmax(totals[leaders], axis=1)
+        alone = present.sum(axis=1) == 1
+        winners[alone] = np.argmax(present[alone], axis=1)
+        return winners
+
+    def step(self, actions: np.ndarray):
+        """ Apply one action (by index) in every game that is not over """
+        active = self.winners() == self.ONGOING
+        launch = active & (actions != self.FORTIFY)
+        games = np.nonzero(launch)[0]
+        if len(games):
+            count, rest = np.divmod(actions[games], self.planets_count ** 2)
+            sources, destinations = np.divmod(rest, self.planets_count)
+            ships = np.array(self.COUNTS, dtype=np.int64)[count]
+            slots = np.argmax(self.fleet_owners[games] < 0, axis=1)
+            assert (self.fleet_owners[games, slots] < 0).all(), "No room!"
+            self.fleet_owners[games, slots] = self.owners[games, sources]
+            self.fleet_ships[games, slots] = ships
+            self.fleet_destinations[games, slots] = destinations
+            self.fleet_arrivals[games, slots] = (
+                self.turn[games] + self.distances[sources, destinations])
+            self.fleet_orders[games, slots] = self.fleet_counter[games]
+            self.fleet_counter[games] += 1
+            self.ships[games, sources] -= ships * 100
+        self.current_player[active] += 1
+        self.remaining_turns[active] -= 1
+        end_of_turn = active & (self.current_player == self.players_count)
+        if end_of_turn.any():
+            self.__end_turn(end_of_turn)
+            self.current_player[end_of_turn] = 0
+        return self
+
+    def play(self,
+             rng: np.random.Generator,
+             max_plies: Optional[int] = None) -> np.ndarray:
+        """
+        Play random games until they are all over (or for `max_plies`)
+
+        Returns `winners()`.
+        """
+        plies = 0
+        while (self.winners() == self.ONGOING).any():
+            if max_plies is not None and plies >= max_plies:
+                break
+            self.step(self.random_actions(rng))
+            plies += 1
+        return self.winners()
+
+    def __end_turn(self, games: np.ndarray):
+        # Production
+        produced = np.minimum(self.capacities, self.ships + self.productions)
+        produce = games[:, None] & (self.owners != NEUTRAL)
+        self.ships = np.where(produce, produced, self.ships)
+
+        # Arrivals, one fleet per game at a time, in the order of launch
+        arriving = (games[:, None]
+                    & (self.fleet_owners >= 0)
+                    & (self.fleet_arrivals == self.turn[:, None]))
+        orders = np.where(arriving, self.fleet_orders, np.iinfo(np.int64).max)
+        slots = np.argsort(orders, axis=1, kind="stable")
+        counts = arriving.sum(axis=1)
+        for k in range(counts.max(initial=0)):
+            fighting = np.nonzero(counts > k)[0]
+            slot = slots[fighting, k]
+            self.__arrival(fighting,
+                           self.fleet_owners[fighting, slot],
+                           self.fleet_ships[fighting, slot],
+                           self.fleet_destinations[fighting, slot])
+        self.fleet_owners[arriving] = -1
+        self.turn[games] += 1
+
+    def __arrival(self,
+                  games: np.ndarray,
+                  owners: np.ndarray,
+                  ships: np.ndarray,
+                  destinations: np.ndarray):
+        defenders = self.ships[games, destinations]
+        capacities = self.capacities[destinations]
+        reinforce = self.owners[games, destinations] == owners
+        remaining_defenders = defenders - self.KILL_RATE * ships
+        captured = ~reinforce & (remaining_defenders < 0)
+        alive_ships = np.trunc(100 * ships - 100 * defenders / 70)
+        new_ships = np.where(reinforce,
+                             np.minimum(capacities, defenders + ships * 100),
+                             np.where(captured,
+                                      np.minimum(capacities,
+                                                 alive_ships.astype(np.int64)),
+                                      remaining_defenders))
+        self.ships[games, destinations] = new_ships
+        self.owners[games, destinations] = np.where(
+            captured, owners, self.owners[games, destinations])
+
+
+def differential_check(games: int = 32, seed: int = 0) -> int:
+    """
+    Play random games with `BatchUniverse` and `Universe` side by side
+
+    Both engines take the same actions; after every ply, the legal actions,
+    the planets, the fleets in flight and the winner of every game must be
+    the same. Returns the number of plies that have been compared.
+    """
+    import random
+    from contextlib import redirect_stdout
+    from io import StringIO
+
+    random.seed(seed)
+    with redirect_stdout(StringIO()):
+        state = Universe(["first", "second"], 4).initialize()
+    batch = BatchUniverse(state, games)
+    universes: List[Universe] = [state.clone() for _ in range(games)]
+    rng = np.random.default_rng(seed)
+    plies = 0
+    while True:
+        winners = batch.winners()
+        mask = batch.legal_mask()
+        for i, universe in enumerate(universes):
+            _compare(batch, i, universe, winners[i], mask[i])
+        if (winners != batch.ONGOING).all():
+            return plies
+        actions = batch.random_actions(rng)
+        for i, universe in enumerate(universes):
+            if winners[i] == batch.ONGOING:
+                universe.apply(batch.action(actions[i]))
+                plies += 1
+        batch.step(actions)
+
+
+def _compare(batch: BatchUniverse,
+             i: int,
+             universe: Universe,
+             winner: int,
+             mask: np.ndarray):
+    is_winner = universe.is_winner()
+    if is_winner is None:
+        expected = batch.ONGOING
+    elif is_winner == 0:
+        expected = batch.DRAW
+    elif is_winner == 1:
+        expected = universe.current_player
+    else:
+        expected = 1 - universe.current_player
+    assert winner == expected, (i, winner, expected)
+    if is_winner is not None:
+        return
+    legal = sorted(batch.index(a) for a in universe.legal_actions())
+    assert legal == list(np.nonzero(mask)[0]), (i, "legal actions")
+    assert batch.current_player[i] == universe.current_player, (i, "player")
+    assert batch.remaining_turns[i] == universe.remaining_turns, (i, "turns")
+    assert list(batch.owners[i]) == list(universe._owners), (i, "owners")
+    assert list(batch.ships[i]) == list(universe._ships), (i, "ships")
+    flying = batch.fleet_owners[i] >= 0
+    fleets = sorted(zip(batch.fleet_orders[i][flying],
+                        batch.fleet_owners[i][flying],
+                        batch.fleet_ships[i][flying],
+                        batch.fleet_destinations[i][flying],
+                        batch.fleet_arrivals[i][flying] - batch.turn[i]))
+    expected_fleets = sorted((f.fleet_id,
+                              OWNERS.index(f.owner),
+                              f.ships,
+                              f.destination_id,
+                              f.distance)
+                             for f in universe.fleets)
+    assert [tuple(map(int, f)) for f in fleets] == expected_fleets, (i, "fleets")
+
+
+if __name__ == "__main__":
+    for seed in range(8):
+        plies = differential_check(games=64, seed=seed)
+        print(f"Seed {seed}: {plies} plies match")
@@ -0,0 +1,211 @@
+from math import isnan
+from struct import Struct
+from typing import (BinaryIO, Iterator, List, NamedTuple, Optional, Sequence,
+                    Tuple)
+
+from envs.konquest import Universe, Galaxy, Action
+
+RECORD_VERSION = 1
+
+# Flags of a move
+TIMED_OUT = 1                        # The agent chose nothing in time
+ILLEGAL = 2                          # The agent chose an illegal action
+
+_MAGIC = b"KQR"
+_HEADER = Struct("<3sBddII")
+_MOVE = Struct("<HH")
+_END = 0xFFFF
+_RESULT = Struct("<b")
+_DRAW = -1
+_SHIPS = (0, 2, 4, 8)
+_MAX_MILLISECONDS = 0xFFFF
+
+
+class Move(NamedTuple):
+    action: Action
+    duration: float                  # Seconds, to the millisecond
+    flags: int = 0
+
+
+def _encode(action: Action, flags: int) -> int:
+    # 2 bits of flags, 2 bits for the ships, 6 bits per planet
+    return ((flags << 14)
+            | (_SHIPS.index(action.ships) << 12)
+            | ((action.source_id + 1) << 6)
+            | (action.destination_id + 1))
+
+
+def _decode(move: int) -> Tuple[Action, int]:
+    return (Action(_SHIPS[(move >> 12) & 3],
+                   ((move >> 6) & 0x3F) - 1,
+                   (move & 0x3F) - 1),
+            move >> 14)
+
+
+class GameRecord:
+    """
+    A played game: its first state, the timeouts and the moves
+
+    The binary layout (little-endian), version `RECORD_VERSION`:
+        3s "KQR", B version, d d timeouts of the players (NaN for none),
+        I length of the galaxy, I length of the first state,
+        `Galaxy.to_bytes()`, `Universe.to_bytes()` of the first state,
+        then for every ply: H the move, H the decision time in milliseconds,
+        and at the end of the game: H 0xFFFF, b index of the winner (-1 for
+        a draw).
+    A move packs two flags (`TIMED_OUT`, `ILLEGAL`), the ships and the source
+    and the destination planets in 16 bits, so a ply takes 4 bytes. Records
+    can be written one after another in the same file; see `read_records()`.
+    """
+
+    def __init__(self,
+                 initial: Universe,
+                 timeouts: Sequence[Optional[float]],
+                 moves: Optional[List[Move]] = None,
+                 winners: Optional[List[int]] = None):
+        self.initial = initial
+        self.timeouts = tuple(timeouts)
+        self.moves = [] if moves is None else moves
+        # None until the game is over
+        self.winners = winners
+
+    def header(self) -> bytes:
+        galaxy = self.initial.galaxy.to_bytes()
+        state = self.initial.to_bytes()
+        return b"".join([_HEADER.pack(_MAGIC,
+                                      RECORD_VERSION,
+                                      *(float('nan') if t is None else t
+                                        for t in self.timeouts),
+                                      len(galaxy),
+                                      len(state)),
+                         galaxy,
+                         state])
+
+    @staticmethod
+    def move_bytes(move: Move) -> bytes:
+        milliseconds = min(_MAX_MILLISECONDS, round(move.duration * 1000))
+        return _MOVE.pack(_encode(move.action, move.flags), milliseconds)
+
+    @staticmethod
+    def end_bytes(winners: List[int]) -> bytes:
+        winner = winners[0] if len(winners) == 1 else _DRAW
+        return _MOVE.pack(_END, 0) + _RESULT.pack(winner)
+
+    def to_bytes(self) -> bytes:
+        output = [self.header()]
+        output.extend(self.move_bytes(move) for move in self.moves)
+        if self.winners is not None:
+            output.append(self.end_bytes(self.winners))
+        return b"".join(output)
+
+    @classmethod
+    def read(cls, stream: BinaryIO) -> Optional['GameRecord']:
+        """
+        Read the next record of `stream`; None at the end of the stream
+
+        A record cut short (a game that was not over) keeps the moves read
+        and has no `winners`.
+        """
+        data = stream.read(_HEADER.size)
+        if not data:
+            return None
+        if len(data) < _HEADER.size:
+            raise ValueError("Truncated game record")
+        magic, version, *timeouts, galaxy_size, state_size = \
+            _HEADER.unpack(data)
+        if magic != _MAGIC:
+            raise ValueError("Not a game record")
+        if version != RECORD_VERSION:
+            raise ValueError(f"Unsupported game record format: {version}")
+        galaxy = Galaxy.from_bytes(stream.read(galaxy_size))
+        initial = Universe.from_bytes(stream.read(state_size), galaxy)
+        record = cls(initial, [None if isnan(t) else t for t in timeouts])
+        while True:
+            data = stream.read(_MOVE.size)
+            if len(data) < _MOVE.size:
+                return record
+            move, milliseconds = _MOVE.unpack(data)
+            if move == _END:
+                winner, = _RESULT.unpack(stream.read(_RESULT.size))
+                record.winners = [] if winner == _DRAW else [winner]
+                return record
+            action, flags = _decode(move)
+            record.moves.append(Move(action, milliseconds / 1000, flags))
+
+
+def read_records(stream: BinaryIO) -> Iterator[GameRecord]:
+    """ Generate the records written one after another in `stream` """
+    while True:
+        record = GameRecord.read(stream)
+        if record is None:
+            return
+        yield record
+
+
+class GameRecorder:
+    """
+    Write a game to a binary stream while it is played
+
+    `Game.play(recorder=...)` calls `start()`, then `record()` after every
+    ply and `finish()` at the end. Every call writes its bytes at once, so
+    a game that is stopped still leaves the moves played.
+    """
+
+    def __init__(self, stream: BinaryIO):
+        self.stream = stream
+
+    def start(self, state: Universe, timeouts: Sequence[Optional[float]]):
+        self.stream.write(GameRecord(state, timeouts).header())
+
+    def record(self, action: Action, duration: float, flags: int = 0):
+        self.stream.write(GameRecord.move_bytes(Move(action,
+                                                     duration,
+                                                     flags)))
+
+    def finish(self, winners: List[int]):
+        self.stream.write(GameRecord.end_bytes(winners))
+        self.stream.flush()
+
+
+class Replay:
+    """
+    Rebuild the states of a recorded game without its agents
+
+    `state(ply)` is the state before the move `ply` (`len(replay)` is the
+    final state). A snapshot is kept every `snapshot_every` plies as they
+    are first reached, so seeking anywhere in the game applies at most that
+    many moves.
+    """
+
+    def __init__(self, record: GameRecord, snapshot_every: int = 32):
+        self.record = record
+        self.snapshot_every = snapshot_every
+        self.__snapshots = [record.initial.clone()]
+
+    def __len__(self):
+        return len(self.record.moves)
+
+    def state(self, ply: int) -> Universe:
+        if not 0 <= ply <= len(self):
+            raise IndexError(f"No ply {ply} in a game of {len(self)} plies")
+        moves = self.record.moves
+        every = self.snapshot_every
+        index = ply // every
+        while len(self.__snapshots) <= index:
+            state = self.__snapshots[-1].clone()
+            start = (len(self.__snapshots) - 1) * every
+            for move in moves[start:start + every]:
+                state.apply(move.action)
+            self.__snapshots.append(state)
+        state = self.__snapshots[index].clone()
+        for move in moves[index * every:ply]:
+            state.apply(move.action)
+        return state
+
+    def __iter__(self) -> Iterator[Universe]:
+        """ Generate the states of every ply, the final one included """
+        state = self.record.initial.clone()
+        yield state.clone()
+        for move in self.record.moves:
+            state.apply(move.action)
+            yield state.clone()
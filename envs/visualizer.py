@@ -20,7 +20,12 @@ class Visualizer:
 
         try:
             visualizer = KonquestVisualizer(initial_state, timeout)
-            commands = {self.__UPDATE_STATE_COMMAND: visualizer.update_state,
+            # States are sent with `Universe.to_bytes()`; the galaxy came
+            # along with `initial_state`
+            def update_state(data: bytes):
+                visualizer.update_state(Universe.from_bytes(data))
+
+            commands = {self.__UPDATE_STATE_COMMAND: update_state,
                         self.__GAME_OVER_COMMAND: visualizer.game_over}
             need_result = set()
             while not KonquestVisualizer.is_closed:
@@ -39,7 +44,9 @@ class Visualizer:
             pass
 
     def update_state(self, state: Universe):
-        self.__connection.send((self.__UPDATE_STATE_COMMAND, (state,), {}))
+        self.__connection.send((self.__UPDATE_STATE_COMMAND,
+                                (state.to_bytes(),),
+                                {}))
 
     def game_over(self, winners):
         self.__connection.send((self.__GAME_OVER_COMMAND, (winners,), {}))
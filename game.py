@@ -1,12 +1,22 @@
 import time
 from typing import List, Optional
 from copy import deepcopy
+from itertools import count
+from inspect import signature
 from random import choice
 
 from agent_interface import AgentInterface
 from envs.environment import AbstractState
-from time_limit import time_limit
+from time_limit import Deadline, time_limit
 from envs.visualizer import Visualizer
+from envs.konquest_record import GameRecorder, TIMED_OUT, ILLEGAL
+from metrics import MetricsSink, PlyMetrics
+from search_stats import SearchStats
+
+# Agents that take a deadline are told to stop this many seconds before they
+# are interrupted, or a tenth of the timeout if that is less, so short
+# timeouts still leave them most of their time
+DEADLINE_MARGIN = 0.05
 
 
 class Game:
@@ -17,11 +27,21 @@ class Game:
              starting_state: AbstractState,
              output=False,
              visualizer: Optional[Visualizer]=None,
-             timeout_per_turn=[None, None]):
+             timeout_per_turn=[None, None],
+             recorder: Optional[GameRecorder]=None,
+             metrics: Optional[MetricsSink]=None):
+        if recorder:
+            recorder.start(starting_state, timeout_per_turn)
         winners = self.__play(starting_state,
                               output,
                               visualizer,
-                              timeout_per_turn)
+                              timeout_per_turn,
+                              recorder,
+                              metrics)
+        if recorder:
+            recorder.finish(winners)
+        if metrics:
+            metrics.close()
         if output:
             print("Game is over!")
             if len(winners) != 1:
@@ -32,13 +52,19 @@ class Game:
             visualizer.game_over(winners)
         return winners
 
-    def __play(self, state: AbstractState, output, visualizer, timeout_per_turn):
+    def __play(self,
+               state: AbstractState,
+               output,
+               visualizer,
+               timeout_per_turn,
+               recorder,
+               metrics):
         duration = None
         action = None
         if output:
             print(state)
-            print("Branching factor:", len(state.successors()))
-        while True:
+            print("Branching factor:", self.__branching_factor(state))
+        for ply in count():
             is_winner = state.is_winner()
             if is_winner is not None:
                 if is_winner == 0:
@@ -46,23 +72,50 @@ class Game:
                 if is_winner == 1:
                     return [state.current_player]
                 return [1 - state.current_player]
-            successors = state.successors()
             start_time = time.time()
-            action = self.__get_action(self.__players[state.current_player],
-                                       state,
-                                       timeout_per_turn[state.current_player])
+            cpu_start_time = time.process_time()
+            action, yields, last_yield = self.__get_action(
+                self.__players[state.current_player],
+                state,
+                timeout_per_turn[state.current_player])
             duration = time.time() - start_time
-            for action_, successor in successors:
-                if action_ == action:
-                    state = successor
-                    break
+            cpu_duration = time.process_time() - cpu_start_time
+            # The search statistics of the decision, kept even if the agent
+            # was interrupted
+            search_stats = getattr(self.__players[state.current_player],
+                                   "stats",
+                                   None)
+            if isinstance(search_stats, SearchStats):
+                search_stats.stop()
             else:
+                search_stats = None
+            if metrics:
+                # Counted before a random action replaces a bad one
+                branching_factor = self.__branching_factor(state)
+            flags = 0
+            if action is None or action not in state.legal_actions():
                 if action is None:
                     print ("Time out!")
+                    flags = TIMED_OUT
                 else:
                     print("Illegal move!")
+                    flags = ILLEGAL
                 print("Choosing a random action!")
-                action, state = choice(successors)
+                action = choice(list(state.legal_actions()))
+            if recorder:
+                recorder.record(action, duration, flags)
+            if metrics:
+                metrics.record(PlyMetrics(ply,
+                                          state.current_player,
+                                          duration,
+                                          cpu_duration,
+                                          yields,
+                                          last_yield,
+                                          flags == TIMED_OUT,
+                                          flags == ILLEGAL,
+                                          branching_factor,
+                                          search_stats))
+            state = state.child(action)
             if visualizer and state.current_player == 0:
                 visualizer.update_state(state)
             if output:
@@ -70,14 +123,33 @@ class Game:
                 print("Action:", action)
                 print("===================================================")
                 print(state)
-                print("Branching factor:", len(state.successors()))
+                print("Branching factor:", self.__branching_factor(state))
+
+    @staticmethod
+    def __branching_factor(state: AbstractState):
+        return sum(1 for _ in state.legal_actions())
 
     def __get_action(self, player: AgentInterface, state, timeout):
+        # Returns the last action yielded, the number of actions yielded and
+        # the seconds until the last one
         action = None
+        yields = 0
+        last_yield = None
+        # The copy is made before the clock starts, so the interruption cannot
+        # land in it
+        state = deepcopy(state)
+        kwargs = {}
+        if "deadline" in signature(player.decide).parameters:
+            kwargs["deadline"] = Deadline(
+                None if timeout is None
+                else timeout - min(DEADLINE_MARGIN, timeout / 10))
+        start_time = time.time()
         try:
             with time_limit(timeout):
-                for decision in player.decide(deepcopy(state)):
+                for decision in player.decide(state, **kwargs):
                     action = decision
+                    yields += 1
+                    last_yield = time.time() - start_time
         except TimeoutError:
             pass
         # NOTE: The following lines will be uncommented during tournament
@@ -86,4 +158,4 @@ class Game:
         #     print()
         #     import traceback
         #     traceback.print_exc()
-        return action
+        return action, yields, last_yield
@@ -1,18 +1,113 @@
+import time
+from inspect import signature
+from typing import List, Optional, Type
+
 from agent_interface import AgentInterface
-from typing import Type
+from search_stats import SearchStats, branching_factor
+from time_limit import Deadline
+
+
+class SearchContext:
+    """
+    What the searches of one decision learn, kept from one depth to the next
+
+    `best_action` is the action chosen by the last completed depth; `nodes`
+    and `durations` hold the number of nodes and the seconds of every
+    completed depth. When the agent does not count its nodes, the branching
+    factor is estimated from the durations.
+    """
+
+    def __init__(self):
+        self.best_action = None
+        self.nodes: List[int] = []
+        self.durations: List[float] = []
+
+    def effective_branching_factor(self) -> Optional[float]:
+        """ Return how many times larger each depth has been than the last """
+        return branching_factor(self.nodes if any(self.nodes)
+                                else self.durations)
+
+    def predicted_duration(self) -> Optional[float]:
+        """ Return the expected seconds of the next depth """
+        branching_factor = self.effective_branching_factor()
+        if branching_factor is None:
+            return None
+        return self.durations[-1] * branching_factor
 
 
 class IterativeDeepening(AgentInterface):
-    def __init__(self, AgentClass: Type[AgentInterface], *args, **kwargs):
-        MAX_DEPTH = 100
-        self.__agents = list()
-        for depth in range(1, MAX_DEPTH):
-            self.__agents.append(AgentClass(*args, depth=depth, **kwargs))
+    """
+    Run a depth-limited agent at increasing depths
+
+    A single agent is built; its `depth` attribute is raised before each
+    search. If its `decide` takes a `context` argument, it receives the
+    `SearchContext` of the decision. When the agent has `stats`, they are
+    added to the `stats` of the whole decision after each depth.
+
+    With a `time_budget` (seconds per decision), a depth that is predicted
+    not to finish in the remaining time, from the effective branching factor
+    of the last depths, is not started: the decision ends with the action of
+    the last completed depth instead of being interrupted. The `deadline`
+    that `Game` passes limits the budget of a decision in the same way, and
+    is passed on to the agent if its `decide` takes one.
+    """
+
+    def __init__(self,
+                 AgentClass: Type[AgentInterface],
+                 *args,
+                 time_budget: Optional[float] = None,
+                 max_depth: int = 99,
+                 **kwargs):
+        self.time_budget = time_budget
+        self.max_depth = max_depth
+        self.__agent = AgentClass(*args, depth=1, **kwargs)
+        self.stats = SearchStats()
+        parameters = signature(self.__agent.decide).parameters
+        self.__takes_context = "context" in parameters
+        self.__takes_deadline = "deadline" in parameters
 
     def info(self):
-        return {'agent name': f'ID-{self.__agents[0].info()["agent name"]}'}
+        return {'agent name': f'ID-{self.__agent.info()["agent name"]}'}
+
+    def close(self):
+        """ Close the agent, if it has anything to close """
+        if hasattr(self.__agent, "close"):
+            self.__agent.close()
 
-    def decide(self, *args, **kwargs):
-        for agent in self.__agents:
-            for decision in agent.decide(*args, **kwargs):
-                yield decision
+    def decide(self,
+               state,
+               *args,
+               deadline: Optional[Deadline] = None,
+               **kwargs):
+        start = time.perf_counter()
+        self.stats = SearchStats()
+        budget = self.time_budget
+        if deadline is not None:
+            budget = min(deadline.remaining(),
+                         float('inf') if budget is None else budget)
+            if self.__takes_deadline:
+                kwargs["deadline"] = deadline
+        context = SearchContext()
+        if self.__takes_context:
+            kwargs["context"] = context
+        for depth in range(1, self.max_depth + 1):
+            if budget is not None:
+                predicted = context.predicted_duration() or 0
+                elapsed = time.perf_counter() - start
+                if elapsed + predicted >= budget:
+                    return
+            self.__agent.depth = depth
+            depth_start = time.perf_counter()
+            try:
+                for decision in self.__agent.decide(state, *args, **kwargs):
+                    context.best_action = decision
+                    yield decision
+            finally:
+                # An interrupted depth counts too
+                agent_stats = getattr(self.__agent, "stats", None)
+                if agent_stats is not None:
+                    self.stats.add(agent_stats)
+            context.durations.append(time.perf_counter() - depth_start)
+            self.stats.complete_depth(depth)
+            if agent_stats is not None:
+                context.nodes.append(agent_stats.nodes)
@@ -1,6 +1,21 @@
-from envs.konquest import Universe
+from envs.konquest import Universe, Action
 from agent_interface import AgentInterface
-import random
+from transposition_table import TranspositionTable, EXACT, LOWER, UPPER
+from parallel_search import RootPool
+from time_limit import Deadline
+from search_stats import SearchStats
+from contextlib import closing
+from functools import partial
+from typing import Dict, List, Optional
+
+INFINITY = float('inf')
+# Half width of the first aspiration window, in heuristic points
+ASPIRATION_WINDOW = 10
+# Width of the null windows of the principal variation search; it only has to
+# be smaller than any real difference between two values
+NULL_WINDOW = 1e-6
+# Number of nodes between two looks at the deadline
+DEADLINE_CHECK = 256
 
 """
 What I have done:
@@ -8,6 +23,13 @@ What I have done:
 - added alpha-beta pruning
 - added iterative deepening
 - tuned the heuristic function
+- added a transposition table that is kept between depths and turns
+- ordered the moves: principal variation, table move, killers and history
+- rewrote the search as negamax with principal variation search, and
+  started every depth with an aspiration window around the last score
+- can share the root moves among several processes
+- stops by itself when the deadline of the game is reached
+- reports its work (nodes, cutoffs, table hits, time per depth) in `stats`
 
 Results:
 - can now find solutions way past the original 4 depth bound
@@ -16,6 +38,10 @@ Results:
 """
 
 
+class _OutOfTime(Exception):
+    pass
+
+
 class Agent(AgentInterface):
 
     @staticmethod
@@ -24,98 +50,296 @@ class Agent(AgentInterface):
                 "student name": ["Sami Talvitie"],  # COMPLETE HERE
                 "student number": ["729624"]}  # COMPLETE HERE
 
-    # Initialize start_depth and max_depth
-    def __init__(self, start_depth: int = 1, max_depth: int = 100):
+    # Initialize start_depth, max_depth, the size of the table and the number
+    # of processes (`None` for one per core)
+    def __init__(self,
+                 start_depth: int = 1,
+                 max_depth: int = 100,
+                 table_megabytes: float = 16,
+                 processes: int = 1):
         # Initialize variables
         self.start_depth = start_depth
         self.max_depth = max_depth
+        self.processes = processes
         self.__player = None
+        self.__deadline = None
+        # The work of the last decision
+        self.stats = SearchStats()
+        self.__table = TranspositionTable(table_megabytes)
+        # Every process has its own agent and table; the processes are
+        # started by the first decision and kept for the next ones
+        self.__pool = None
+        if processes != 1:
+            self.__pool = RootPool(partial(Agent,
+                                           table_megabytes=table_megabytes),
+                                   processes)
+        # Best moves of the last iteration, keyed by `Universe.key`
+        self.__pv: Dict[int, Action] = {}
+        # Moves that caused a cutoff, keyed by `Universe.remaining_turns`
+        self.__killers: Dict[int, List[Action]] = {}
+        # Cutoff scores keyed by (source, destination, ships)
+        self.__history: Dict[tuple, int] = {}
 
     def heuristic(self, state: Universe):
-        # Initialize variables
-        id = state.current_player_id
-        my_ships = 0
-        my_fleets = 0
-        my_production = 0
-        my_planets = 0
-        penalty = 0
-
-        # Calculate values for the heuristic
-        for planet in state.planets:
-            if planet.owner == id:
-                my_ships += planet.ships
-                my_production += planet.info.production
-                my_planets += 1
-                if planet.info.capacity == planet.ships:
-                    penalty += 1
-
-        for fleet in state.fleets:
-            if fleet.owner == id:
-                my_fleets += 1
-
-        return my_ships + my_fleets/2 + my_production*6 + my_planets*5 - penalty*10
+        # The totals are kept up to date by the universe
+        totals = state.totals(state.current_player_id)
+        return (totals.planet_ships + totals.fleets/2 + totals.production*6
+                + totals.planets*5 - totals.full_planets*10)
 
     # Modified with alpha-beta pruning and iterative deepening
-    def decide(self, state: Universe):
+    # The search stops when the deadline expires; the depth in progress is
+    # dropped, but what it stored in the table is kept
+    def decide(self, state: Universe, deadline: Optional[Deadline] = None):
+        try:
+            yield from self.__deepen(state, deadline)
+        except _OutOfTime:
+            pass
+        finally:
+            self.__deadline = None
+
+    def __deepen(self, state: Universe, deadline: Optional[Deadline]):
         # Initialize variables
+        self.__deadline = deadline
+        self.stats = SearchStats()
         best_action = None
-        max_value = float('-inf')
-        alpha = float('-inf')
-        beta = float('inf')
+        values = {}
+        self.new_search()
+        self.__pv = {}
+        # Let the history of the previous turns fade away
+        self.__history = {move: score // 2
+                          for move, score in self.__history.items()
+                          if score > 1}
 
         # Iterative deepening loop
         for depth in range(self.start_depth, self.max_depth + 1):
-            successors = state.successors()
-            random.shuffle(successors)
-
-            # Apply alpha-beta pruning to minimize the number of nodes visited
-            for action, next_state in successors:
-                action_value = self.min_value(next_state, depth - 1, alpha, beta)
-                if action_value > max_value:
-                    max_value = action_value
-                    best_action = action
-                alpha = max(alpha, max_value)
-                if beta <= alpha:
+            if deadline is not None and deadline.expired():
+                return
+            # Every depth starts with a fresh window: either the full one, or
+            # an aspiration window that is opened on the side the value falls
+            # out of. The heuristic only counts the material of the player to
+            # move, so the values of odd and even depths are far apart; the
+            # window is set around the value of two depths before.
+            value = values.get(depth - 2)
+            if value is None or abs(value) == INFINITY:
+                alpha, beta = -INFINITY, INFINITY
+            else:
+                alpha = value - ASPIRATION_WINDOW
+                beta = value + ASPIRATION_WINDOW
+            while True:
+                value, action = self.__root(state, depth, alpha, beta,
+                                            best_action)
+                if value <= alpha and alpha != -INFINITY:
+                    alpha = -INFINITY
+                elif value >= beta and beta != INFINITY:
+                    beta = INFINITY
+                else:
                     break
+            best_action = action
+            values[depth] = value
 
+            self.stats.complete_depth(depth)
+            self.__pv = self.__principal_variation(state, best_action, depth)
             print("Depth:", depth, "Best action: ", best_action) # Uncomment to print best moves
             # Yield the best action found at the current depth
             yield best_action
 
-    # This function now takes alpha and beta values as inputs
-    def max_value(self, state: Universe, depth: int, alpha: float, beta: float):
+    def __root(self,
+               state: Universe,
+               depth: int,
+               alpha: float,
+               beta: float,
+               last_best_action: Optional[Action]):
+        # Searches every root move within (alpha, beta); the search applies
+        # and undoes moves on `state` itself
+        original_alpha = alpha
+        best_value = -INFINITY
+        best_action = None
+        actions = self.__ordered_actions(state, last_best_action)
+        young_brothers = []
+        if self.__pool is not None:
+            # Young brothers wait: the first move is searched here to get a
+            # bound, then the other ones are shared among the processes
+            actions, young_brothers = actions[:1], actions[1:]
+        for i, action in enumerate(actions):
+            action_value = self.root_value(state, action, depth, alpha, beta,
+                                           i == 0)
+            if best_action is None or action_value > best_value:
+                best_value = action_value
+                best_action = action
+            alpha = max(alpha, best_value)
+            if beta <= alpha:
+                break
+        if young_brothers and alpha < beta:
+            with closing(self.__pool.search(state, young_brothers,
+                                            depth, alpha, beta)) as results:
+                for action, action_value in results:
+                    if (self.__deadline is not None
+                            and self.__deadline.expired()):
+                        raise _OutOfTime()
+                    if action_value > best_value:
+                        best_value = action_value
+                        best_action = action
+                    if beta <= best_value:
+                        break
+        self.__store(state, depth, best_value, original_alpha, beta,
+                     best_action)
+        return best_value, best_action
+
+    def new_search(self):
+        # Ages the results of the earlier decisions in the table; the
+        # processes of the pool call it for every new root state
+        self.__table.new_search()
+
+    def close(self):
+        # Stops the processes of the pool, if any
+        if self.__pool is not None:
+            self.__pool.close()
+
+    def root_value(self,
+                   state: Universe,
+                   action: Action,
+                   depth: int,
+                   alpha: float,
+                   beta: float,
+                   first: bool = False):
+        # Returns the value of the root move `action`; `state` is left
+        # unchanged
+        undo = state.apply(action)
+        action_value = self.__search_child(state, depth, alpha, beta, first)
+        state.undo(undo)
+        return action_value
+
+    def __search_child(self,
+                       child: Universe,
+                       depth: int,
+                       alpha: float,
+                       beta: float,
+                       first: bool):
+        # Returns the value of `child` for its parent. Apart from the first
+        # one, children are searched with a null window to prove that they
+        # are not better than alpha, and searched again if they are. There is
+        # no null window above an alpha of -inf (every move so far loses): it
+        # would be empty, and its fail-high values would be stored as upper
+        # bounds.
+        if first or alpha == -INFINITY:
+            return -self.negamax(child, depth - 1, -beta, -alpha)
+        value = -self.negamax(child, depth - 1, -alpha - NULL_WINDOW, -alpha)
+        if alpha < value < beta:
+            value = -self.negamax(child, depth - 1, -beta, -value)
+        return value
+
+    # This function takes alpha and beta values as inputs, and returns the
+    # value of `state` for the player to move
+    def negamax(self, state: Universe, depth: int, alpha: float, beta: float):
+        stats = self.stats
+        stats.nodes += 1
+        if (self.__deadline is not None
+                and stats.nodes % DEADLINE_CHECK == 0
+                and self.__deadline.expired()):
+            raise _OutOfTime()
         # Termination conditions
         is_winner = state.is_winner()
         if is_winner is not None:
-            return is_winner * float('inf')
+            return is_winner * INFINITY if is_winner else 0
         if depth == 0:
+            stats.leaves += 1
             return self.heuristic(state)
+        known_value, best_move = self.__probe(state, depth, alpha, beta)
+        if known_value is not None:
+            return known_value
 
         # If it is not terminated
-        successors = state.successors()
-        value = float('-inf')
-        for _, next_state in successors:
-            value = max(value, self.min_value(next_state, depth - 1, alpha, beta))
+        value = -INFINITY
+        original_alpha = alpha
+        actions = self.__ordered_actions(state, best_move)
+        for i, action in enumerate(actions):
+            undo = state.apply(action)
+            action_value = self.__search_child(state, depth, alpha, beta,
+                                               i == 0)
+            state.undo(undo)
+            if action_value > value:
+                value = action_value
+                best_move = action
             alpha = max(alpha, value)
             if beta <= alpha:
+                self.__cutoff(state, action, depth)
+                stats.cutoff(depth)
                 break
+        self.__store(state, depth, value, original_alpha, beta, best_move)
         return value
 
-    # This function now takes alpha and beta values as inputs
-    def min_value(self, state: Universe, depth: int, alpha: float, beta: float):
-        # Termination conditions
-        is_winner = state.is_winner()
-        if is_winner is not None:
-            return is_winner * float('-inf')
-        if depth == 0:
-            return -1 * self.heuristic(state)
+    def __probe(self, state: Universe, depth: int, alpha: float, beta: float):
+        # Returns the value of `state` if the table is enough to know it, and
+        # the best move found by an earlier search
+        self.stats.table_probes += 1
+        entry = self.__table.probe(state.key)
+        if entry is None:
+            return None, None
+        self.stats.table_hits += 1
+        entry_depth, bound, value, best_move = entry
+        if entry_depth >= depth and (bound == EXACT
+                                     or (bound == LOWER and value >= beta)
+                                     or (bound == UPPER and value <= alpha)):
+            return value, best_move
+        return None, best_move
 
-        # If it is not terminated
-        successors = state.successors()
-        value = float('inf')
-        for _, next_state in successors:
-            value = min(value, self.max_value(next_state, depth - 1, alpha, beta))
-            if value <= alpha:
-                return value
-            beta = min(beta, value)
-        return value
+    def __store(self,
+                state: Universe,
+                depth: int,
+                value: float,
+                alpha: float,
+                beta: float,
+                best_move: Optional[Action]):
+        if value <= alpha:
+            bound = UPPER
+        elif value >= beta:
+            bound = LOWER
+        else:
+            bound = EXACT
+        self.__table.store(state.key, depth, bound, value, best_move)
+
+    def __principal_variation(self,
+                              state: Universe,
+                              best_action: Action,
+                              depth: int):
+        # Follows the best moves in the table from `state`
+        pv = {state.key: best_action}
+        undos = [state.apply(best_action)]
+        for _ in range(depth - 1):
+            entry = self.__table.probe(state.key)
+            if entry is None or entry[3] not in state.legal_actions():
+                break
+            pv[state.key] = entry[3]
+            undos.append(state.apply(entry[3]))
+        for undo in reversed(undos):
+            state.undo(undo)
+        return pv
+
+    def __ordered_actions(self, state: Universe, table_move: Optional[Action]):
+        # Principal variation move, table move, killer moves, and then the
+        # rest by their history score
+        pv_move = self.__pv.get(state.key)
+        killers = self.__killers.get(state.remaining_turns, ())
+        history = self.__history
+
+        def priority(action: Action):
+            if action == pv_move:
+                return 3, 0
+            if action == table_move:
+                return 2, 0
+            if action in killers:
+                return 1, 0
+            return 0, history.get((action.source_id,
+                                   action.destination_id,
+                                   action.ships), 0)
+
+        return sorted(state.legal_actions(), key=priority, reverse=True)
+
+    def __cutoff(self, state: Universe, action: Action, depth: int):
+        # Remembers `action` as a killer and in the history
+        killers = self.__killers.setdefault(state.remaining_turns, [])
+        if action not in killers:
+            killers.insert(0, action)
+            del killers[2:]
+        move = (action.source_id, action.destination_id, action.ships)
+        self.__history[move] = self.__history.get(move, 0) + depth * depth
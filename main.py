@@ -11,6 +11,7 @@ from random_agent import RandomAgent
 from minimax_agent import MinimaxAgent
 from id_minimax_agent import IDMinimaxAgent
 from markov_agent import MarkovAgent
+from mcts_agent import MCTSAgent
 from kari_grandi import Agent    # After completing your agent, you can uncomment this line
 
 
@@ -25,6 +26,7 @@ def main():
     # players = [RandomAgent, IDMinimaxAgent]
     # players = [MarkovAgent, RandomAgent]
     # players = [IDMinimaxAgent, MarkovAgent]
+    # players = [MCTSAgent, MarkovAgent]
 
     players = [Agent, MarkovAgent]   #<-- Uncomment this to test your agent
     ###############################################
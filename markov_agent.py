@@ -1,28 +1,173 @@
+from contextlib import closing
+from functools import partial
+from math import log, sqrt, tanh
 from random import shuffle
+from typing import Optional
 from agent_interface import AgentInterface
-from envs.konquest import Universe
-from random_agent import RandomAgent
-from game import Game
+from envs.konquest import Universe, Totals, playout
+from parallel_rollouts import RolloutWorkers
+from time_limit import Deadline
+
+ALLOCATIONS = ("uniform", "ucb1", "halving")
+
+
+def _expired(deadline: Optional[Deadline]) -> bool:
+    return deadline is not None and deadline.expired()
+
+
+def evaluation(totals: Totals) -> float:
+    """ Material and production of a player, like `kari_grandi` counts it """
+    return (totals.planet_ships + totals.fleets/2 + totals.production*6
+            + totals.planets*5 - totals.full_planets*10)
 
 
 class MarkovAgent(AgentInterface):
     """
     Evaluate each action by taking it, followed by
     random plays. The action with most wins is chosen.
+
+    With a `horizon`, the random plays stop after that many moves (of either
+    player). The position reached is then scored as a win probability: the
+    logistic function of the difference of `evaluation()` of the players,
+    divided by `scale`.
+
+    `allocation` sets how the random plays are shared among the actions:
+    - "uniform": every action gets one play per round;
+    - "ucb1": a round is as many plays as actions, each one given to the
+      action with the highest upper confidence bound; the most played action
+      is chosen;
+    - "halving": sequential halving; the actions get the same number of plays
+      and the worse half of them is dropped, until one is left. Then it starts
+      again with all the actions and twice as many plays. The best of the
+      remaining actions is chosen.
+    An action is yielded after every round. With a `deadline`, the decision
+    stops by itself in the middle of a round, after yielding the best action
+    found so far.
+
+    With `processes` other than 1 (`None` for one per core), the random plays
+    are shared among that many processes, which only support the "uniform"
+    allocation. The processes are started by the first decision and kept for
+    the next ones; every worker plays rounds of all the actions and sends
+    back its wins after each round.
     """
-    def __init__(self):
-        self.__simulator = Game([RandomAgent(), RandomAgent()])
+    def __init__(self,
+                 horizon: Optional[int] = None,
+                 scale: float = 20,
+                 allocation: str = "uniform",
+                 exploration: float = sqrt(2),
+                 processes: int = 1):
+        if allocation not in ALLOCATIONS:
+            raise ValueError(f"Unknown allocation: {allocation}")
+        if processes != 1 and allocation != "uniform":
+            raise ValueError("Parallel rollouts need the uniform allocation")
+        self.horizon = horizon
+        self.scale = scale
+        self.allocation = allocation
+        self.exploration = exploration
+        self.processes = processes
+        self.__workers = None
+        if processes != 1:
+            self.__workers = RolloutWorkers(partial(MarkovAgent,
+                                                    horizon,
+                                                    scale),
+                                            processes)
 
     def info(self):
         return {"agent name": "Markov"}
 
-    def decide(self, state: Universe):
-        successors = state.successors()
-        shuffle(successors)
-        win_counter = [0] * len(successors)
+    def decide(self, state: Universe, deadline: Optional[Deadline] = None):
+        actions = list(state.legal_actions())
+        shuffle(actions)
+        if self.__workers is not None:
+            return self.__parallel(state, actions, deadline)
+        if self.allocation == "ucb1":
+            return self.__ucb1(state, actions, deadline)
+        if self.allocation == "halving":
+            return self.__halving(state, actions, deadline)
+        return self.__uniform(state, actions, deadline)
+
+    def __uniform(self, state: Universe, actions, deadline):
+        win_counter = [0] * len(actions)
+        while True:
+            for i, action in enumerate(actions):
+                win_counter[i] += self.rollout(state.child(action),
+                                               state.current_player)
+                if _expired(deadline):
+                    break
+            yield actions[win_counter.index(max(win_counter))]
+            if _expired(deadline):
+                return
+
+    def __parallel(self, state: Universe, actions, deadline):
+        win_counter = [0] * len(actions)
+        with closing(self.__workers.rollouts(state, actions)) as batches:
+            for wins in batches:
+                for i, win in enumerate(wins):
+                    win_counter[i] += win
+                yield actions[win_counter.index(max(win_counter))]
+                if _expired(deadline):
+                    return
+
+    def close(self):
+        """ Stop the processes of the parallel rollouts """
+        if self.__workers is not None:
+            self.__workers.close()
+
+    def __ucb1(self, state: Universe, actions, deadline):
+        win_counter = [0] * len(actions)
+        play_counter = [0] * len(actions)
+        total = 0
+        while True:
+            for _ in actions:
+                if total < len(actions):
+                    i = total
+                else:
+                    bound = self.exploration * sqrt(log(total))
+                    i = max(range(len(actions)),
+                            key=lambda j: (win_counter[j] / play_counter[j]
+                                           + bound / sqrt(play_counter[j])))
+                win_counter[i] += self.rollout(state.child(actions[i]),
+                                               state.current_player)
+                play_counter[i] += 1
+                total += 1
+                if _expired(deadline):
+                    break
+            yield actions[play_counter.index(max(play_counter))]
+            if _expired(deadline):
+                return
+
+    def __halving(self, state: Universe, actions, deadline):
+        win_counter = [0] * len(actions)
+        play_counter = [0] * len(actions)
+        plays = 1
         while True:
-            for i, (_, next_state) in enumerate(successors):
-                result = self.__simulator.play(output=False, 
-                                               starting_state=next_state)
-                win_counter[i] += 1 if result == [state.current_player] else 0
-            yield successors[win_counter.index(max(win_counter))][0]
\ No newline at end of file
+            candidates = list(range(len(actions)))
+            while True:
+                for _ in range(plays):
+                    for i in candidates:
+                        win_counter[i] += self.rollout(state.child(actions[i]),
+                                                       state.current_player)
+                        play_counter[i] += 1
+                        if _expired(deadline):
+                            break
+                    candidates.sort(key=lambda j: (win_counter[j]
+                                                   / max(1, play_counter[j])),
+                                    reverse=True)
+                    yield actions[candidates[0]]
+                    if _expired(deadline):
+                        return
+                if len(candidates) == 1:
+                    break
+                del candidates[(len(candidates) + 1) // 2:]
+            plays *= 2
+
+    def rollout(self, state: Universe, player: int) -> float:
+        """ Return the chance of `player` to win after a random play """
+        result = playout(state, self.horizon)
+        if result is not None:
+            return 1 if result == [player] else 0
+        players = state.players
+        difference = (evaluation(state.totals(players[player].id_))
+                      - evaluation(state.totals(players[1 - player].id_)))
+        # The logistic function, written so that it cannot overflow
+        return (1 + tanh(difference / (2 * self.scale))) / 2
@@ -0,0 +1,207 @@
+"""
+Play an A/B match between two agents until the result is decided
+
+Every pair of games is played on a new map, once on each side, like
+`main.py` does. After each pair a sequential probability ratio test (SPRT)
+weighs the hypothesis that the first agent is `--elo1` Elo stronger than the
+second against the hypothesis that it is only `--elo0` stronger; the match
+stops as soon as one of them is accepted. For example:
+
+    python3 match.py kari_grandi old_kari_grandi:Agent --elo0 0 --elo1 20 \
+        --timeout 1 --processes 4
+
+The agents are given as for `tournament.py`.
+"""
+import argparse
+import json
+import multiprocessing
+import random
+from contextlib import closing
+from math import log, log10
+from typing import Dict, Iterator, Optional
+
+from tournament import (GameSpec, NEUTRAL_PLANETS_COUNT, agent_name,
+                        colour_swapped, play_games)
+
+# One imaginary pair, spread evenly over the five results, is added to the
+# counts: a one-sided start then cannot end the match with a variance of zero
+PRIOR_PAIRS = 1
+
+
+def expected_score(elo: float) -> float:
+    return 1 / (1 + 10 ** (-elo / 400))
+
+
+def elo(score: float) -> float:
+    """ The Elo difference of an expected `score` """
+    score = min(max(score, 1e-6), 1 - 1e-6)
+    return -400 * log10(1 / score - 1)
+
+
+class SPRT:
+    """
+    A sequential probability ratio test of the Elo difference
+
+    The pairs of games are counted by the score of the first agent over
+    both games (0, 1/4, 1/2, 3/4 or 1), so the advantage of a map or of a
+    side cancels out. The log-likelihood ratio is the generalized one, with
+    the normal approximation of the mean score of a pair.
+    """
+
+    def __init__(self,
+                 elo0: float = 0,
+                 elo1: float = 10,
+                 alpha: float = 0.05,
+                 beta: float = 0.05):
+        self.elo0 = elo0
+        self.elo1 = elo1
+        # H0 is accepted below `lower` and H1 above `upper`
+        self.lower = log(beta / (1 - alpha))
+        self.upper = log((1 - beta) / alpha)
+        self.pairs = [0] * 5
+
+    def add(self, score: float):
+        """ Count a pair of games where the first agent scored `score` """
+        self.pairs[round(score * 4)] += 1
+
+    def score(self) -> float:
+        pairs = sum(self.pairs)
+        if not pairs:
+            return 0.5
+        return sum(i / 4 * n for i, n in enumerate(self.pairs)) / pairs
+
+    def llr(self) -> float:
+        """ Return the log-likelihood ratio of H1 against H0 """
+        if not sum(self.pairs):
+            return 0.0
+        pairs = [n + PRIOR_PAIRS / 5 for n in self.pairs]
+        total = sum(pairs)
+        mean = sum(i / 4 * n for i, n in enumerate(pairs)) / total
+        variance = sum((i / 4 - mean) ** 2 * n
+                       for i, n in enumerate(pairs)) / total
+        score0 = expected_score(self.elo0)
+        score1 = expected_score(self.elo1)
+        return (total * (score1 - score0) * (2 * mean - score0 - score1)
+                / (2 * variance))
+
+    def result(self) -> Optional[str]:
+        """ Return "H0" or "H1" once one is accepted, else None """
+        llr = self.llr()
+        if llr >= self.upper:
+            return "H1"
+        if llr <= self.lower:
+            return "H0"
+        return None
+
+
+def _pairs(agents, names, timeout, neutrals_count, max_pairs,
+           seed) -> Iterator[GameSpec]:
+    map_seeds = random.Random(seed)
+    for pair in range(max_pairs):
+        yield from colour_swapped(2 * pair, pair, map_seeds.randrange(2**32),
+                                  agents, names, timeout, neutrals_count)
+
+
+def play_match(first: str,
+               second: str,
+               sprt: SPRT,
+               timeout: Optional[float] = 5,
+               neutrals_count: int = NEUTRAL_PLANETS_COUNT,
+               max_pairs: int = 10000,
+               processes: Optional[int] = None,
+               seed: Optional[int] = None) -> Iterator[Dict]:
+    """
+    Play pairs of games until `sprt` accepts a hypothesis
+
+    The record of every game is generated as it ends; the ones of a
+    finished pair get the state of the test. The games still played when
+    the test ends are stopped. A pair with a failed game is left out of the
+    test.
+    """
+    agents = (first, second)
+    names = {spec: agent_name(spec) for spec in agents}
+    halves: Dict[int, Dict] = {}
+    games = _pairs(agents, names, timeout, neutrals_count, max_pairs, seed)
+    # Closing the games explicitly stops the ones still played as soon as
+    # the test ends, without waiting for the generator to be freed
+    with closing(play_games(games, processes, seed)) as results:
+        for record in results:
+            other = halves.pop(record["map"], None)
+            if other is None:
+                halves[record["map"]] = record
+                yield record
+                continue
+            if not (record.get("error") or other.get("error")):
+                sprt.add(sum(_score(r, first) for r in (record, other)) / 2)
+            record.update(pairs=sum(sprt.pairs),
+                          llr=round(sprt.llr(), 3),
+                          elo=round(elo(sprt.score()), 1))
+            yield record
+            if sprt.result() is not None:
+                return
+
+
+def _score(record: Dict, spec: str) -> float:
+    if record["winner"] is None:
+        return 0.5
+    return 1.0 if record["winner"] == spec else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("first", help="the agent tested, module[:Class]")
+    parser.add_argument("second", help="the reference agent")
+    parser.add_argument("--elo0", type=float, default=0,
+                        help="Elo difference of H0")
+    parser.add_argument("--elo1", type=float, default=10,
+                        help="Elo difference of H1")
+    parser.add_argument("--alpha", type=float, default=0.05,
+                        help="chance to accept H1 when H0 holds")
+    parser.add_argument("--beta", type=float, default=0.05,
+                        help="chance to accept H0 when H1 holds")
+    parser.add_argument("--max-pairs", type=int, default=10000)
+    parser.add_argument("--timeout", type=float, default=5,
+                        help="seconds per move")
+    parser.add_argument("--neutrals", type=int, default=NEUTRAL_PLANETS_COUNT,
+                        help="neutral planets per map")
+    parser.add_argument("--processes", type=int, default=None,
+                        help="games played at the same time (default: cores)")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--output", default=None,
+                        help="file of the results, one JSON line per game")
+    args = parser.parse_args()
+
+    sprt = SPRT(args.elo0, args.elo1, args.alpha, args.beta)
+    output = open(args.output, "w") if args.output else None
+    try:
+        for record in play_match(args.first, args.second, sprt, args.timeout,
+                                 args.neutrals, args.max_pairs,
+                                 args.processes, args.seed):
+            if output:
+                output.write(json.dumps(record) + "\n")
+                output.flush()
+            if "llr" in record:
+                print(f"{record['pairs']} pairs) Elo {record['elo']:+.1f}, "
+                      f"LLR {record['llr']:.2f} "
+                      f"[{sprt.lower:.2f}, {sprt.upper:.2f}]")
+    finally:
+        if output:
+            output.close()
+    print()
+    print(f"Pairs (0, 1/4, 1/2, 3/4, 1 for {args.first}): {sprt.pairs}")
+    result = sprt.result()
+    if result == "H1":
+        print(f"H1 accepted: {args.first} is stronger by at least "
+              f"{args.elo1} Elo")
+    elif result == "H0":
+        print(f"H0 accepted: {args.first} is not stronger by "
+              f"{args.elo1} Elo")
+    else:
+        print("Undecided after the maximum number of pairs")
+
+
+if __name__ == "__main__":
+    import platform
+    if platform.system() == "Darwin":
+        multiprocessing.set_start_method('spawn')
+    main()
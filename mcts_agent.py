@@ -0,0 +1,147 @@
+import random
+from math import log, sqrt
+from typing import Callable, List, Optional
+
+from agent_interface import AgentInterface
+from envs.konquest import Universe, Action
+from time_limit import Deadline
+
+
+def random_policy(state: Universe) -> Action:
+    """ Play a random legal action """
+    return state.random_action()
+
+
+class _Node:
+    # A node of the search tree; the statistics are from the point of view of
+    # `player`, who took `action` to reach the node
+    __slots__ = ("key", "action", "player", "children", "untried",
+                 "visits", "wins")
+
+    def __init__(self, key: int, action: Optional[Action], player: int):
+        self.key = key
+        self.action = action
+        self.player = player
+        self.children: List['_Node'] = []
+        self.untried: Optional[List[Action]] = None
+        self.visits = 0
+        self.wins = 0.0
+
+
+class MCTSAgent(AgentInterface):
+    """
+    Evaluate the actions with Monte Carlo tree search
+
+    The tree is searched with UCT: the children are selected by their upper
+    confidence bound until a node with untried actions is reached, one of them
+    is added to the tree, and the rest of the game is played by
+    `playout_policy`. A win counts 1 and a draw 1/2.
+
+    The tree is kept between decisions: the next decision starts from the
+    node of the new state, which is found among the grandchildren of the old
+    root, so the search of the previous turn is not lost.
+    """
+
+    def __init__(self,
+                 exploration: float = sqrt(2),
+                 playout_policy: Callable[[Universe], Action] = random_policy,
+                 yield_every: int = 32):
+        self.exploration = exploration
+        self.playout_policy = playout_policy
+        self.yield_every = yield_every
+        self.__root: Optional[_Node] = None
+
+    def info(self):
+        return {"agent name": "MCTS"}
+
+    def decide(self, state: Universe, deadline: Optional[Deadline] = None):
+        # With a deadline the search stops between two iterations, so the
+        # tree is never left half updated
+        root = self.__reroot(state)
+        iterations = 0
+        while deadline is None or not deadline.expired():
+            self.__iterate(root, state)
+            iterations += 1
+            if iterations % self.yield_every == 0 and root.children:
+                yield max(root.children, key=lambda c: c.visits).action
+        if root.children:
+            yield max(root.children, key=lambda c: c.visits).action
+
+    def __reroot(self, state: Universe) -> _Node:
+        # Keeps the subtree of `state` if the last tree has it: the state is
+        # two moves (ours and the opponent's) after the last root
+        root = self.__root
+        candidates = []
+        if root is not None:
+            candidates.append(root)
+            candidates.extend(root.children)
+            for child in root.children:
+                candidates.extend(child.children)
+        for node in candidates:
+            if node.key == state.key:
+                break
+        else:
+            node = _Node(state.key, None, -1)
+        node.action = None
+        self.__root = node
+        return node
+
+    def __iterate(self, root: _Node, state: Universe):
+        # Selection and expansion apply the moves to `state` itself; they are
+        # taken back once the result is known
+        path = [root]
+        undos = []
+        node = root
+        while state.is_winner() is None:
+            if node.untried is None:
+                node.untried = list(state.legal_actions())
+                random.shuffle(node.untried)
+            if node.untried:
+                # Expansion; the child is added before the action is removed
+                # from the untried ones, so an interruption loses nothing
+                action = node.untried[-1]
+                player = state.current_player
+                undos.append(state.apply(action))
+                child = _Node(state.key, action, player)
+                node.children.append(child)
+                node.untried.pop()
+                path.append(child)
+                break
+            node = self.__select(node)
+            undos.append(state.apply(node.action))
+            path.append(node)
+
+        winner = self.__playout(state)
+        for undo in reversed(undos):
+            state.undo(undo)
+
+        for node in path:
+            node.visits += 1
+            if winner is None:
+                node.wins += 0.5
+            elif winner == node.player:
+                node.wins += 1
+
+    def __select(self, node: _Node) -> _Node:
+        log_visits = log(node.visits)
+
+        def uct(child: _Node):
+            if child.visits == 0:
+                return float('inf')
+            return (child.wins / child.visits
+                    + self.exploration * sqrt(log_visits / child.visits))
+
+        return max(node.children, key=uct)
+
+    def __playout(self, state: Universe) -> Optional[int]:
+        # Returns the index of the winner, or None for a draw
+        state = state.clone()
+        is_winner = state.is_winner()
+        while is_winner is None:
+            state.apply(self.playout_policy(state))
+            is_winner = state.is_winner()
+        if is_winner == 0:
+            return None
+        if is_winner == 1:
+            return state.current_player
+        return 1 - state.current_player
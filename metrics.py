@@ -0,0 +1,163 @@
+import csv
+import json
+from bisect import bisect_left
+from typing import Dict, List, NamedTuple, Optional, Sequence, TextIO
+
+from search_stats import SearchStats
+
+
+class PlyMetrics(NamedTuple):
+    """ What `Game` measures of one decision """
+    ply: int
+    player: int                      # Index of the player who decided
+    wall_time: float                 # Seconds of the decision
+    cpu_time: float                  # Seconds of CPU of the game's process
+    yields: int                      # Actions yielded by the agent
+    last_yield: Optional[float]      # Seconds until the last one, if any
+    timed_out: bool                  # Nothing yielded in time
+    illegal: bool                    # The last action yielded was illegal
+    branching_factor: int            # Legal actions of the state
+    search: Optional[SearchStats] = None  # For agents that have `stats`
+
+    def as_dict(self) -> dict:
+        """ The metrics as plain values, the search ones in a dict """
+        values = self._asdict()
+        if self.search is not None:
+            values["search"] = self.search.as_dict()
+        return values
+
+
+class MetricsSink:
+    """
+    Where `Game.play(metrics=...)` sends the metrics of every ply
+
+    `record()` is called after every decision and `close()` once the game is
+    over. A sink may be given to several games in a row.
+    """
+
+    def record(self, metrics: PlyMetrics):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class JSONLSink(MetricsSink):
+    """ Write one JSON object per ply; `fields` are added to every line """
+
+    def __init__(self, stream: TextIO, **fields):
+        self.stream = stream
+        self.fields = fields
+
+    def record(self, metrics: PlyMetrics):
+        self.stream.write(json.dumps({**self.fields, **metrics.as_dict()})
+                          + "\n")
+
+    def close(self):
+        self.stream.flush()
+
+
+class CSVSink(MetricsSink):
+    """
+    Write one CSV row per ply, after a header row
+
+    The search statistics, if any, are written as JSON in the last column.
+    """
+
+    def __init__(self, stream: TextIO, header: bool = True):
+        self.stream = stream
+        self.__writer = csv.writer(stream)
+        if header:
+            self.__writer.writerow(PlyMetrics._fields)
+
+    def record(self, metrics: PlyMetrics):
+        values = metrics.as_dict()
+        if values["search"] is not None:
+            values["search"] = json.dumps(values["search"])
+        self.__writer.writerow(values.values())
+
+    def close(self):
+        self.stream.flush()
+
+
+class TeeSink(MetricsSink):
+    """ Send the metrics to every one of `sinks` """
+
+    def __init__(self, *sinks: MetricsSink):
+        self.sinks = sinks
+
+    def record(self, metrics: PlyMetrics):
+        for sink in self.sinks:
+            sink.record(metrics)
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
+
+
+# Upper bounds of the buckets of `LatencyHistogram`, in seconds
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 3, 4,
+                   4.5, 4.75, 4.9, 5, 6, 10)
+
+
+class LatencyHistogram(MetricsSink):
+    """
+    Count the decisions of every player by wall time, in memory
+
+    A decision falls in the first bucket whose bound is at least its wall
+    time; the ones above the last bound are in an extra bucket. The timeouts
+    and illegal moves, which `Game` replaces by a random action, are counted
+    apart.
+    """
+
+    def __init__(self, buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts: Dict[int, List[int]] = {}
+        self.timeouts: Dict[int, int] = {}
+        self.illegals: Dict[int, int] = {}
+        self.maximums: Dict[int, float] = {}
+        self.totals: Dict[int, float] = {}
+
+    def record(self, metrics: PlyMetrics):
+        player = metrics.player
+        if player not in self.counts:
+            self.counts[player] = [0] * (len(self.buckets) + 1)
+            self.timeouts[player] = 0
+            self.illegals[player] = 0
+            self.maximums[player] = 0.0
+            self.totals[player] = 0.0
+        self.counts[player][bisect_left(self.buckets, metrics.wall_time)] += 1
+        self.timeouts[player] += metrics.timed_out
+        self.illegals[player] += metrics.illegal
+        self.maximums[player] = max(self.maximums[player], metrics.wall_time)
+        self.totals[player] += metrics.wall_time
+
+    def quantile(self, player: int, q: float) -> float:
+        """ Return the bound of the bucket that holds the `q` quantile """
+        counts = self.counts[player]
+        rank = q * sum(counts)
+        seen = 0
+        for bound, count in zip(self.buckets, counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+    def summary(self) -> str:
+        lines = []
+        for player in sorted(self.counts):
+            counts = self.counts[player]
+            decisions = sum(counts)
+            lines.append(
+                f"Player {player}: {decisions} decisions, "
+                f"mean {self.totals[player] / decisions:.3f}s, "
+                f"p50 <= {self.quantile(player, 0.5)}s, "
+                f"p99 <= {self.quantile(player, 0.99)}s, "
+                f"max {self.maximums[player]:.3f}s, "
+                f"{self.timeouts[player]} timeouts, "
+                f"{self.illegals[player]} illegal moves")
+            bounds = [f"<={bound}" for bound in self.buckets] + [
+                f">{self.buckets[-1]}"]
+            lines.extend(f"  {bound:>8}s {count}"
+                         for bound, count in zip(bounds, counts) if count)
+        return "\n".join(lines)
@@ -1,6 +1,11 @@
 import random
+from contextlib import closing
+from typing import Optional
 from agent_interface import AgentInterface
-from envs.konquest import Universe, ID
+from envs.konquest import Universe, Action, ID
+from iterative_deepening import SearchContext
+from parallel_search import RootPool
+from search_stats import SearchStats
 
 
 class MinimaxAgent(AgentInterface):
@@ -8,40 +13,91 @@ class MinimaxAgent(AgentInterface):
     An agent who plays the Konquest game using Minimax algorithm
     """
 
-    def __init__(self, depth: int = 4):
+    def __init__(self, depth: int = 4, processes: int = 1):
+        """
+        Search `depth` moves ahead
+
+        NOTE: with `processes` other than 1, the root moves are searched by
+        that many processes (`None` for one per core). They are started by
+        the first decision and kept for the next ones.
+        """
         self.depth = depth
+        self.processes = processes
+        # The work of the last decision
+        self.stats = SearchStats()
         self.__player = None
+        self.__pool = None
+        if processes != 1:
+            self.__pool = RootPool(MinimaxAgent, processes)
 
     def info(self):
         return {"agent name": f"Minimax-simple"}
 
+    def close(self):
+        """ Stop the processes of the root search """
+        if self.__pool is not None:
+            self.__pool.close()
+
     def heuristic(self, state: Universe):
-        id = state.current_player_id
-        my_ships = 0
-        for planet in state.planets:
-            if planet.owner == id:
-                my_ships += planet.ships
-        for fleet in state.fleets:
-            if fleet.owner == id:
-                my_ships += fleet.ships
-        return my_ships
-
-    def decide(self, state: Universe):
+        # The totals are kept up to date by the universe
+        return state.totals(state.current_player_id).ships
+
+    def decide(self,
+               state: Universe,
+               context: Optional[SearchContext] = None):
         """
         Get the value of each action by passing its successor to min_value
         function.
+
+        The successors are not copied; each action is applied to `state` in
+        place and taken back once its value is known.
+
+        With several processes, the actions are shared among them and the
+        best action is yielded every time it changes.
+
+        NOTE: when `IterativeDeepening` passes the `context` of the decision,
+        the best action of the last depth is tried first, so it is kept
+        unless another action is strictly better.
         """
-        successors = state.successors()
-        random.shuffle(successors)
-        best_action, _ = successors[0]
+        self.stats = SearchStats()
+        actions = list(state.legal_actions())
+        random.shuffle(actions)
+        if context is not None and context.best_action in actions:
+            actions.remove(context.best_action)
+            actions.insert(0, context.best_action)
+        best_action = actions[0]
         max_value = float('-inf')
-        for action, next_state in successors:
-            action_value = self.min_value(next_state, self.depth - 1)
+        if self.__pool is not None:
+            with closing(self.__pool.search(state, actions,
+                                            self.depth)) as results:
+                for action, action_value in results:
+                    if action_value > max_value:
+                        max_value = action_value
+                        best_action = action
+                        yield best_action
+            self.stats.complete_depth(self.depth)
+            yield best_action
+            return
+        for action in actions:
+            action_value = self.root_value(state, action)
             if action_value > max_value:
                 max_value = action_value
                 best_action = action
+        self.stats.complete_depth(self.depth)
         yield best_action
 
+    def root_value(self,
+                   state: Universe,
+                   action: Action,
+                   depth: Optional[int] = None):
+        """ Return the value of `action`; `state` is left unchanged """
+        if depth is None:
+            depth = self.depth
+        undo = state.apply(action)
+        action_value = self.min_value(state, depth - 1)
+        state.undo(undo)
+        return action_value
+
     def max_value(self, state: Universe, depth: int):
         """
         Get the value of each action by passing its successor to min_value
@@ -61,17 +117,20 @@ class MinimaxAgent(AgentInterface):
         """
 
         # Termination conditions
+        self.stats.nodes += 1
         is_winner = state.is_winner()
         if is_winner is not None:
             return is_winner * float('inf')
         if depth == 0:
+            self.stats.leaves += 1
             return self.heuristic(state)
 
         # If it is not terminated
-        successors = state.successors()
         value = float('-inf')
-        for _, next_state in successors:
-            value = max(value, self.min_value(next_state, depth - 1))
+        for action in state.legal_actions():
+            undo = state.apply(action)
+            value = max(value, self.min_value(state, depth - 1))
+            state.undo(undo)
         return value
 
     def min_value(self, state: Universe, depth):
@@ -93,15 +152,18 @@ class MinimaxAgent(AgentInterface):
         """
 
         # Termination conditions
+        self.stats.nodes += 1
         is_winner = state.is_winner()
         if is_winner is not None:
             return is_winner * float('-inf')
         if depth == 0:
+            self.stats.leaves += 1
             return -1 * self.heuristic(state)
 
         # If it is not terminated
-        successors = state.successors()
         value = float('inf')
-        for _, next_state in successors:
-            value = min(value, self.max_value(next_state, depth - 1))
+        for action in state.legal_actions():
+            undo = state.apply(action)
+            value = min(value, self.max_value(state, depth - 1))
+            state.undo(undo)
         return value
\ No newline at end of file
@@ -0,0 +1,116 @@
+import multiprocessing
+import signal
+from multiprocessing.connection import wait
+from typing import Callable, Iterator, List, Optional
+
+from agent_interface import AgentInterface
+from envs.konquest import Universe, Action
+
+
+def _work(connection, factory: Callable[[], AgentInterface]):
+    # Plays rollouts of the current decision until another message comes:
+    # `(decision, state, actions, rounds)` starts a decision, `(decision,)`
+    # stops it, and `None` ends the worker
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    agent = factory()
+    task = None
+    while True:
+        if task is None or connection.poll():
+            message = connection.recv()
+            if message is None:
+                return
+            task = message if len(message) > 1 else None
+            continue
+        decision, state, actions, rounds = task
+        player = state.current_player
+        wins = [0] * len(actions)
+        for _ in range(rounds):
+            for i, action in enumerate(actions):
+                wins[i] += agent.rollout(state.child(action), player)
+        connection.send((decision, wins))
+
+
+class RolloutWorkers:
+    """
+    Persistent processes that play the rollouts of a Monte Carlo agent
+
+    Every worker builds its own agent with `factory`, which must be picklable
+    (a class or a `functools.partial` of it); the agent must have a
+    `rollout(state, player)` method that returns the chance of `player` to
+    win. The processes are started by the first decision and kept until
+    `close()`.
+
+    For each decision the state is sent once to every worker, which then
+    plays `rounds` rollouts of every action per batch and sends back the
+    wins of the batch, until the decision is left.
+    """
+
+    def __init__(self,
+                 factory: Callable[[], AgentInterface],
+                 processes: Optional[int] = None,
+                 rounds: int = 1):
+        self.__factory = factory
+        self.__processes = processes or multiprocessing.cpu_count()
+        self.__rounds = rounds
+        self.__workers = []
+        self.__connections = []
+        self.__decision = 0
+
+    def rollouts(self,
+                 state: Universe,
+                 actions: List[Action]) -> Iterator[List[float]]:
+        """ Generate the wins of every action, one batch at a time """
+        while len(self.__workers) < self.__processes:
+            self.__start()
+        self.__decision += 1
+        decision = self.__decision
+        for connection in self.__connections:
+            connection.send((decision, state, actions, self.__rounds))
+        receiving = None
+        try:
+            while True:
+                for connection in wait(self.__connections):
+                    receiving = connection
+                    message = connection.recv()
+                    receiving = None
+                    if message[0] == decision:
+                        yield message[1]
+        finally:
+            if receiving is not None:
+                # An interrupted `recv()` may leave half a message in the
+                # pipe; that worker is replaced
+                self.__replace(self.__connections.index(receiving))
+            for connection in self.__connections:
+                connection.send((decision,))
+
+    def close(self):
+        for connection in self.__connections:
+            connection.send(None)
+        for worker in self.__workers:
+            worker.join()
+        self.__workers = []
+        self.__connections = []
+
+    def __start(self):
+        connection, worker_connection = multiprocessing.Pipe()
+        worker = multiprocessing.Process(target=_work,
+                                         args=(worker_connection,
+                                               self.__factory),
+                                         daemon=True)
+        worker.start()
+        self.__workers.append(worker)
+        self.__connections.append(connection)
+
+    def __replace(self, index: int):
+        self.__workers.pop(index).terminate()
+        self.__connections.pop(index).close()
+        self.__start()
+
+    def __getstate__(self):
+        # Processes cannot be sent to another one; the copy starts its own
+        return {"_RolloutWorkers__factory": self.__factory,
+                "_RolloutWorkers__processes": self.__processes,
+                "_RolloutWorkers__rounds": self.__rounds,
+                "_RolloutWorkers__workers": [],
+                "_RolloutWorkers__connections": [],
+                "_RolloutWorkers__decision": 0}
@@ -0,0 +1,108 @@
+import multiprocessing
+import signal
+from typing import Callable, Iterator, Optional, Tuple
+
+from agent_interface import AgentInterface
+from envs.konquest import Universe, Action
+
+# The state of a worker process
+_agent: Optional[AgentInterface] = None
+_generation = None                   # Shared with the agent's process
+_task_generation = 0
+_root_key = None                     # Key of the root of the last task
+
+
+class _Cancelled(Exception):
+    pass
+
+
+def _initialize(factory: Callable[[], AgentInterface], generation):
+    global _agent, _generation
+    # Interrupting the game must not kill the workers
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _generation = generation
+    _agent = factory()
+    heuristic = _agent.heuristic
+
+    def checked_heuristic(state):
+        # Leaves are frequent enough to notice a cancelled search quickly
+        if _generation.value != _task_generation:
+            raise _Cancelled()
+        return heuristic(state)
+
+    _agent.heuristic = checked_heuristic
+
+
+def _search(task):
+    global _task_generation, _root_key
+    _task_generation, state, action, args = task
+    if _generation.value != _task_generation:
+        return action, None
+    if state.key != _root_key:
+        # A new decision; the searches of the old ones can be aged
+        _root_key = state.key
+        if hasattr(_agent, "new_search"):
+            _agent.new_search()
+    try:
+        return action, _agent.root_value(state, action, *args)
+    except _Cancelled:
+        return action, None
+
+
+class RootPool:
+    """
+    A pool of processes that search the root moves of an agent in parallel
+
+    Every worker builds its own agent with `factory`, which must be picklable
+    (a class or a `functools.partial` of it), and keeps it for the life of
+    the pool. The agent must have a `root_value(state, action, *args)` method
+    that applies `action` to `state` and returns its value. If it has a
+    `new_search()` method, a worker calls it before the first move of every
+    new root state, as the agent would at the start of a decision.
+
+    The processes are started by the first search and reused by the next
+    ones. When a search is left before all its results came in (a cutoff or
+    a time out), the workers drop the rest of its moves.
+    """
+
+    def __init__(self,
+                 factory: Callable[[], AgentInterface],
+                 processes: Optional[int] = None):
+        self.__factory = factory
+        self.__processes = processes or multiprocessing.cpu_count()
+        self.__pool = None
+        self.__generation = None
+
+    def search(self,
+               state: Universe,
+               actions,
+               *args) -> Iterator[Tuple[Action, float]]:
+        """ Generate `(action, value)` pairs as soon as they are known """
+        if self.__pool is None:
+            self.__generation = multiprocessing.RawValue('i', 0)
+            self.__pool = multiprocessing.Pool(
+                self.__processes,
+                initializer=_initialize,
+                initargs=(self.__factory, self.__generation))
+        self.__generation.value += 1
+        generation = self.__generation.value
+        tasks = [(generation, state, action, args) for action in actions]
+        try:
+            for action, value in self.__pool.imap_unordered(_search, tasks):
+                if value is not None:
+                    yield action, value
+        finally:
+            # Cancel the moves that are still searched or waiting
+            self.__generation.value += 1
+
+    def close(self):
+        if self.__pool is not None:
+            self.__pool.terminate()
+            self.__pool = None
+
+    def __getstate__(self):
+        # A pool cannot be sent to another process; the copy starts its own
+        return {"_RootPool__factory": self.__factory,
+                "_RootPool__processes": self.__processes,
+                "_RootPool__pool": None,
+                "_RootPool__generation": None}
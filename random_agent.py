@@ -9,5 +9,5 @@ class RandomAgent(AgentInterface):
         return {"agent name": "Random"}
 
     def decide(self, state: AbstractState):
-        actions = [action for action, _ in state.successors()]
+        actions = list(state.legal_actions())
         yield random.choice(actions)
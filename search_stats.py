@@ -0,0 +1,102 @@
+import time
+from math import sqrt
+from typing import Dict, List, Optional, Sequence
+
+
+def branching_factor(sizes: Sequence[float]) -> Optional[float]:
+    """
+    Return how many times larger each depth has been than the last
+
+    `sizes` are the sizes (nodes or seconds) of the completed depths. The
+    factor is averaged over the last two depths when there are three of them,
+    as the branching factors of the two players may differ.
+    """
+    if len(sizes) >= 3 and sizes[-3] > 0:
+        return sqrt(sizes[-1] / sizes[-3])
+    if len(sizes) >= 2 and sizes[-2] > 0:
+        return sizes[-1] / sizes[-2]
+    return None
+
+
+class SearchStats:
+    """
+    The work of a search agent during one decision
+
+    A search agent sets its `stats` attribute to a new `SearchStats` at the
+    start of every decision and fills it in as it searches; `Game` collects
+    it once the decision is over, even when the agent was interrupted.
+    `cutoffs` are counted by the remaining depth of the node that was cut
+    off. Only the work of the agent's own process is counted.
+    """
+
+    def __init__(self):
+        self.nodes = 0
+        self.leaves = 0                  # Heuristic evaluations
+        self.cutoffs: Dict[int, int] = {}
+        self.table_probes = 0
+        self.table_hits = 0
+        self.completed_depth = 0
+        # Nodes and seconds of every completed depth
+        self.depth_nodes: List[int] = []
+        self.depth_times: List[float] = []
+        self.seconds: Optional[float] = None
+        self.__start = time.perf_counter()
+        self.__depth_start = self.__start
+        self.__depth_nodes_start = 0
+
+    def cutoff(self, depth: int):
+        self.cutoffs[depth] = self.cutoffs.get(depth, 0) + 1
+
+    def complete_depth(self, depth: int):
+        """ Close the depth searched since the last one was completed """
+        now = time.perf_counter()
+        self.completed_depth = depth
+        self.depth_nodes.append(self.nodes - self.__depth_nodes_start)
+        self.depth_times.append(now - self.__depth_start)
+        self.__depth_start = now
+        self.__depth_nodes_start = self.nodes
+
+    def add(self, other: 'SearchStats'):
+        """ Count the work of `other` too, apart from its depths """
+        self.nodes += other.nodes
+        self.leaves += other.leaves
+        for depth, cutoffs in other.cutoffs.items():
+            self.cutoffs[depth] = self.cutoffs.get(depth, 0) + cutoffs
+        self.table_probes += other.table_probes
+        self.table_hits += other.table_hits
+
+    def stop(self):
+        """ Stop the clock of the decision; later calls change nothing """
+        if self.seconds is None:
+            self.seconds = time.perf_counter() - self.__start
+
+    def elapsed(self) -> float:
+        if self.seconds is not None:
+            return self.seconds
+        return time.perf_counter() - self.__start
+
+    def nodes_per_second(self) -> float:
+        elapsed = self.elapsed()
+        return self.nodes / elapsed if elapsed > 0 else 0.0
+
+    def effective_branching_factor(self) -> Optional[float]:
+        return branching_factor(self.depth_nodes)
+
+    def table_hit_rate(self) -> Optional[float]:
+        if not self.table_probes:
+            return None
+        return self.table_hits / self.table_probes
+
+    def as_dict(self) -> dict:
+        return {"nodes": self.nodes,
+                "leaves": self.leaves,
+                "cutoffs": self.cutoffs,
+                "completed_depth": self.completed_depth,
+                "depth_nodes": self.depth_nodes,
+                "depth_times": self.depth_times,
+                "effective_branching_factor":
+                    self.effective_branching_factor(),
+                "table_probes": self.table_probes,
+                "table_hit_rate": self.table_hit_rate(),
+                "seconds": self.elapsed(),
+                "nodes_per_second": self.nodes_per_second()}
@@ -1,8 +1,32 @@
 from contextlib import contextmanager
+from typing import Optional
 import threading
+import time
 import _thread
 
 
+class Deadline:
+    """
+    The time left for a decision
+
+    Agents that take a `deadline` argument in `decide` receive one from
+    `Game`, so they can plan their time and stop by themselves; `time_limit`
+    still interrupts the ones that do not stop in time.
+    """
+
+    def __init__(self, seconds: Optional[float]):
+        self.__end = None if seconds is None else time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        """ Return the seconds left; `inf` when there is no limit """
+        if self.__end is None:
+            return float('inf')
+        return max(0.0, self.__end - time.monotonic())
+
+    def expired(self) -> bool:
+        return self.__end is not None and time.monotonic() >= self.__end
+
+
 @contextmanager
 def time_limit(seconds):
     if seconds is None:
@@ -20,4 +44,3 @@ def time_limit(seconds):
     finally:
         # if the action ends in specified time, timer is canceled
         timer.cancel()
-
@@ -0,0 +1,318 @@
+"""
+Play many games between agents, several at a time, without a window
+
+Every agent is given as `module` or `module:Class`; with the module alone,
+the agent class defined in it is used. For example:
+
+    python3 tournament.py kari_grandi markov_agent random_agent:RandomAgent \
+        --maps 50 --timeout 1 --processes 4 --output results.jsonl
+
+Every pair of agents plays each map twice, once on each side. With
+`--gauntlet`, only the first agent plays, against each of the others. Every
+game runs in a process of its own and its result is written to the output,
+one JSON object per line, as soon as it is over. With `--records`, the moves
+of every game are also kept in a binary file; see `envs/konquest_record.py`.
+With `--metrics`, the time and the outcome of every decision are written to
+a JSONL file; see `metrics.py`.
+"""
+import argparse
+import importlib
+import io
+import json
+import multiprocessing
+import os
+import random
+import time
+from contextlib import redirect_stdout
+from itertools import combinations
+from multiprocessing.connection import wait
+from typing import (BinaryIO, Dict, Iterable, Iterator, List, NamedTuple,
+                    Optional, TextIO, Tuple, Type)
+
+from agent_interface import AgentInterface
+from envs.konquest import Universe
+from envs.konquest_record import GameRecorder
+from game import Game
+from metrics import JSONLSink
+
+NEUTRAL_PLANETS_COUNT = 4
+
+
+class GameSpec(NamedTuple):
+    """ One game to play: the agents are in the order of `state.players` """
+    index: int
+    map: int
+    agents: Tuple[str, str]
+    state: Universe
+    timeouts: Tuple[Optional[float], Optional[float]]
+
+
+def load_agent(spec: str) -> Type[AgentInterface]:
+    """ Return the agent class of `module` or `module:Class` """
+    module_name, _, class_name = spec.partition(":")
+    module = importlib.import_module(module_name)
+    if class_name:
+        return getattr(module, class_name)
+    classes = [value for value in vars(module).values()
+               if isinstance(value, type)
+               and issubclass(value, AgentInterface)
+               and value.__module__ == module.__name__]
+    if len(classes) != 1:
+        raise ValueError(f"Cannot tell the agent of {module_name}; "
+                         "use module:Class")
+    return classes[0]
+
+
+def agent_name(spec: str) -> str:
+    return load_agent(spec)().info()["agent name"]
+
+
+def make_map(seed: int, names: List[str], neutrals_count: int) -> Universe:
+    """ Create map `seed`; the same seed gives the same planets """
+    state = random.getstate()
+    random.seed(seed)
+    try:
+        with redirect_stdout(io.StringIO()):
+            return Universe(names, neutrals_count)
+    finally:
+        random.setstate(state)
+
+
+def _play(connection,
+          game: GameSpec,
+          seed: int,
+          record: bool,
+          measure: bool):
+    # Runs in its own process, so `time_limit` interrupts this main thread
+    random.seed(seed)
+    start = time.time()
+    recording = io.BytesIO() if record else None
+    measures = io.StringIO() if measure else None
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        players = [load_agent(spec)() for spec in game.agents]
+        winners = Game(players).play(
+            game.state.clone().initialize(),
+            timeout_per_turn=list(game.timeouts),
+            recorder=GameRecorder(recording) if record else None,
+            metrics=JSONLSink(measures, game=game.index) if measure else None)
+        for player in players:
+            if hasattr(player, "close"):
+                player.close()
+    connection.send((winners,
+                     time.time() - start,
+                     recording.getvalue() if record else None,
+                     measures.getvalue() if measure else None))
+
+
+def colour_swapped(index: int,
+                   map_index: int,
+                   map_seed: int,
+                   pairing: Tuple[str, str],
+                   names: Dict[str, str],
+                   timeout: Optional[float] = 5,
+                   neutrals_count: int = NEUTRAL_PLANETS_COUNT
+                   ) -> List[GameSpec]:
+    """
+    Return the two games of `pairing` on map `map_seed`, numbered from
+    `index`; the players are rotated for the second one as in `main.py`
+    """
+    games = []
+    for rotations in range(2):
+        # The clones of a universe share its players, so every side gets a
+        # universe of its own
+        state = make_map(map_seed,
+                         [names[spec] for spec in pairing],
+                         neutrals_count)
+        for _ in range(rotations):
+            state.rotate_players()
+        games.append(GameSpec(index + rotations, map_index,
+                              pairing[rotations:] + pairing[:rotations],
+                              state, (timeout, timeout)))
+    return games
+
+
+def play_games(games: Iterable[GameSpec],
+               processes: Optional[int] = None,
+               seed: Optional[int] = None,
+               records: Optional[BinaryIO] = None,
+               metrics: Optional[TextIO] = None) -> Iterator[Dict]:
+    """
+    Play `games` in parallel and generate their results as they finish
+
+    At most `processes` games (one per core by default) are played at the
+    same time, each one in a new process. The games are taken from `games`
+    only when a process is free, so it may be a lazy iterator. A game whose
+    process dies is reported with an `error` and no winner. Closing the
+    generator stops the games still played.
+
+    With `records`, the record of every finished game is appended to that
+    binary file, at the `record` offset given in its result. With
+    `metrics`, the metrics of every ply are written to that file as JSON
+    lines, with the `game` index.
+    """
+    processes = processes or multiprocessing.cpu_count()
+    seeds = random.Random(seed)
+    pending = iter(games)
+    running = {}
+    try:
+        while True:
+            while len(running) < processes:
+                game = next(pending, None)
+                if game is None:
+                    break
+                connection, child_connection = multiprocessing.Pipe(False)
+                process = multiprocessing.Process(
+                    target=_play,
+                    args=(child_connection, game, seeds.randrange(2**32),
+                          records is not None, metrics is not None))
+                process.start()
+                child_connection.close()
+                running[connection] = (process, game)
+            if not running:
+                return
+            # The result is read as soon as it comes: a process cannot end
+            # before the whole of it is out of the pipe. A process that dies
+            # closes its end of the pipe instead.
+            for connection in wait(list(running)):
+                process, game = running.pop(connection)
+                try:
+                    result = connection.recv()
+                except EOFError:
+                    result = None
+                connection.close()
+                process.join()
+                record = _record(game, result, process.exitcode)
+                if records is not None and result is not None:
+                    record["record"] = records.tell()
+                    records.write(result[2])
+                    records.flush()
+                if metrics is not None and result is not None:
+                    metrics.write(result[3])
+                    metrics.flush()
+                yield record
+    finally:
+        for connection, (process, _) in running.items():
+            process.terminate()
+            process.join()
+            connection.close()
+
+
+def _record(game: GameSpec, result, exitcode: int) -> Dict:
+    record = {"game": game.index,
+              "map": game.map,
+              "players": list(game.agents),
+              "names": [player.name for player in game.state.players],
+              "timeouts": list(game.timeouts)}
+    if result is None:
+        record.update(winner=None, error=f"Exit code {exitcode}")
+        return record
+    winners, duration = result[:2]
+    record.update(winner=game.agents[winners[0]] if len(winners) == 1
+                  else None,
+                  duration=round(duration, 3))
+    return record
+
+
+def schedule(agents: List[str],
+             maps: int,
+             gauntlet: bool = False,
+             timeout: Optional[float] = 5,
+             neutrals_count: int = NEUTRAL_PLANETS_COUNT,
+             seed: Optional[int] = None) -> List[GameSpec]:
+    """
+    List the games of a round-robin, or of a gauntlet of the first agent
+
+    Map `i` is the same in every pairing; each pairing plays it twice, with
+    the players rotated.
+    """
+    if gauntlet:
+        pairings = [(agents[0], other) for other in agents[1:]]
+    else:
+        pairings = list(combinations(agents, 2))
+    names = {spec: agent_name(spec) for spec in agents}
+    map_seeds = random.Random(seed)
+    games = []
+    for map_index in range(maps):
+        map_seed = map_seeds.randrange(2**32)
+        for pairing in pairings:
+            games.extend(colour_swapped(len(games), map_index, map_seed,
+                                        pairing, names, timeout,
+                                        neutrals_count))
+    return games
+
+
+def standings(records: List[Dict], agents: List[str]) -> str:
+    """ Return a table of the wins, draws and losses of every agent """
+    scores = {spec: [0, 0, 0] for spec in agents}
+    for record in records:
+        if record.get("error"):
+            continue
+        for spec in record["players"]:
+            if record["winner"] is None:
+                scores[spec][1] += 1
+            else:
+                scores[spec][0 if record["winner"] == spec else 2] += 1
+    lines = [f"{'Agent':<32}{'Wins':>7}{'Draws':>7}{'Losses':>7}{'Score':>8}"]
+    for spec, (wins, draws, losses) in sorted(
+            scores.items(), key=lambda item: -(item[1][0] + item[1][1] / 2)):
+        played = wins + draws + losses
+        score = (wins + draws / 2) / played if played else 0
+        lines.append(f"{spec:<32}{wins:>7}{draws:>7}{losses:>7}"
+                     f"{score:>8.1%}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("agents", nargs="+",
+                        help="agents as module or module:Class")
+    parser.add_argument("--gauntlet", action="store_true",
+                        help="only the first agent plays the others")
+    parser.add_argument("--maps", type=int, default=5,
+                        help="maps per pairing, each played twice")
+    parser.add_argument("--timeout", type=float, default=5,
+                        help="seconds per move")
+    parser.add_argument("--neutrals", type=int, default=NEUTRAL_PLANETS_COUNT,
+                        help="neutral planets per map")
+    parser.add_argument("--processes", type=int, default=None,
+                        help="games played at the same time (default: cores)")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--output", default="tournament.jsonl",
+                        help="file of the results, one JSON line per game")
+    parser.add_argument("--records", default=None,
+                        help="binary file to keep the moves of the games")
+    parser.add_argument("--metrics", default=None,
+                        help="file of the metrics, one JSON line per move")
+    args = parser.parse_args()
+    if len(args.agents) < 2:
+        parser.error("at least two agents are needed")
+
+    games = schedule(args.agents, args.maps, args.gauntlet, args.timeout,
+                     args.neutrals, args.seed)
+    records = []
+    moves = open(args.records, "wb") if args.records else None
+    metrics = open(args.metrics, "w") if args.metrics else None
+    try:
+        with open(args.output, "w") as output:
+            for record in play_games(games, args.processes, args.seed, moves,
+                                     metrics):
+                output.write(json.dumps(record) + "\n")
+                output.flush()
+                records.append(record)
+                players = " vs ".join(record["players"])
+                result = record.get("error") or record["winner"] or "draw"
+                print(f"{len(records)}/{len(games)}) {players}: {result}")
+    finally:
+        if moves:
+            moves.close()
+        if metrics:
+            metrics.close()
+    print()
+    print(standings(records, args.agents))
+
+
+if __name__ == "__main__":
+    import platform
+    if platform.system() == "Darwin":
+        multiprocessing.set_start_method('spawn')
+    main()
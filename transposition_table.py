@@ -0,0 +1,107 @@
+from array import array
+from typing import Optional, Tuple
+
+from envs.konquest import Action
+
+# Bound types of the stored values
+EXACT = 0
+LOWER = 1                            # The value is at least the stored one
+UPPER = 2                            # The value is at most the stored one
+
+# Bytes an entry takes: key, value, move, depth, bound and age
+_ENTRY_SIZE = 8 + 8 + 4 + 1 + 1 + 1
+_NO_MOVE = -1
+
+
+def _pack(action: Optional[Action]) -> int:
+    if action is None:
+        return _NO_MOVE
+    return ((action.ships << 16)
+            | ((action.source_id + 1) << 8)
+            | (action.destination_id + 1))
+
+
+def _unpack(move: int) -> Optional[Action]:
+    if move == _NO_MOVE:
+        return None
+    return Action(move >> 16, ((move >> 8) & 0xFF) - 1, (move & 0xFF) - 1)
+
+
+class TranspositionTable:
+    """
+    A fixed-size table of search results keyed by `Universe.key`
+
+    The table takes about `megabytes` of memory whatever the number of stored
+    results. It is made of buckets of two entries: the first entry of a bucket
+    keeps the deepest result (or the latest one if it comes from an older
+    search), the second entry always takes the results that do not fit in the
+    first one.
+
+    The values must be from the point of view of the player to move, so the
+    same table can be used for both players and for every turn of a game.
+    Call `new_search()` at the start of each decision to age the results of
+    the previous ones.
+    """
+
+    def __init__(self, megabytes: float = 16):
+        self.__buckets = max(1, int(megabytes * 2**20) // (2 * _ENTRY_SIZE))
+        size = 2 * self.__buckets
+        self.__keys = array('Q', bytes(8 * size))
+        self.__values = array('d', bytes(8 * size))
+        self.__moves = array('i', [_NO_MOVE]) * size
+        self.__depths = array('b', bytes(size))
+        self.__bounds = array('b', bytes(size))
+        self.__ages = array('B', bytes(size))
+        self.__age = 0
+
+    def __len__(self):
+        return len(self.__keys)
+
+    def new_search(self):
+        self.__age = (self.__age + 1) & 0xFF
+
+    def probe(self,
+              key: int) -> Optional[Tuple[int, int, float, Optional[Action]]]:
+        """ Return `(depth, bound, value, best_move)` of `key` if stored """
+        keys = self.__keys
+        i = (key % self.__buckets) * 2
+        if keys[i] != key:
+            i += 1
+            if keys[i] != key:
+                return None
+        return (self.__depths[i],
+                self.__bounds[i],
+                self.__values[i],
+                _unpack(self.__moves[i]))
+
+    def store(self,
+              key: int,
+              depth: int,
+              bound: int,
+              value: float,
+              best_move: Optional[Action]):
+        keys = self.__keys
+        i = (key % self.__buckets) * 2
+        if (    self.__ages[i] == self.__age
+            and depth < self.__depths[i]
+            and keys[i] != 0):
+            # Keep the deeper result of the current search
+            i += 1
+        move = _pack(best_move)
+        if move == _NO_MOVE and keys[i] == key:
+            # Failing low gives no best move; keep the one we already know
+            move = self.__moves[i]
+        # The key is cleared first, so an interrupted store leaves no entry
+        # with mixed fields behind
+        keys[i] = 0
+        self.__values[i] = value
+        self.__moves[i] = move
+        self.__depths[i] = depth
+        self.__bounds[i] = bound
+        self.__ages[i] = self.__age
+        keys[i] = key
+
+    def clear(self):
+        size = len(self.__keys)
+        self.__keys = array('Q', bytes(8 * size))
+        self.__moves = array('i', [_NO_MOVE]) * size